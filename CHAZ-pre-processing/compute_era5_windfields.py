@@ -4,16 +4,59 @@
 Compute CHAZ windfields from track simulations using Holland (2008) wind model.
 """
 
-import sys
-import copy
+import argparse
 import numpy as np
 from pathlib import Path
+from scipy import sparse
 from pathos.pools import ProcessPool as Pool
 from climada.hazard import Centroids, TCTracks, TropCyclone
 from climada.util.constants import SYSTEM_DIR
 
-def main(i_file):
+from preproc_utils import default_n_workers, input_fingerprint, load_manifest, is_complete, record_output
+
+# Centroids are loaded once per worker process and reused for all of its chunks
+_CENTROIDS = {}
+
+
+def load_centroids(cent_file):
+    """Load the global centroids, cached per process."""
+    key = str(cent_file)
+    if key not in _CENTROIDS:
+        _CENTROIDS[key] = Centroids.from_hdf5(cent_file)
+    return _CENTROIDS[key]
+
+
+def expand_to_centroids(tc, centroids, sel_idx):
+    """Remap intensity and fraction columns of tc, computed on centroids[sel_idx], to the full centroid set."""
+    for attr in ['intensity', 'fraction']:
+        mat = getattr(tc, attr).tocsr()
+        if mat.shape[1] != sel_idx.size:
+            continue
+        setattr(tc, attr, sparse.csr_matrix(
+            (mat.data, sel_idx[mat.indices], mat.indptr), shape=(mat.shape[0], centroids.size)
+        ))
+    tc.centroids = centroids
+    return tc
+
+
+def compute_chunk(tracks_chunk, cent_file, out_file):
+    """Compute H08 windfields for one chunk of tracks and write them to out_file."""
+    tracks_chunk.equal_timestep(time_step_h=.5)
+
+    # Only pass the centroids within the buffered extent of this chunk to the wind model
+    cent = load_centroids(cent_file)
+    sel_cen = cent.select_mask(extent=tracks_chunk.get_extent(5))
+    cent_chunk = cent.select(sel_cen=sel_cen)
+
+    tc = TropCyclone.from_tracks(tracks_chunk, centroids=cent_chunk, model='H08')
+    tc = expand_to_centroids(tc, cent, np.flatnonzero(sel_cen))
+    tc.write_hdf5(out_file)
+    return out_file
+
+
+def main(i_file, n_workers=None, chunk_size=1000, resume=False):
     i_file = int(i_file)  # Ensemble index: 0..9
+    n_workers = n_workers or default_n_workers()
 
     # Paths and filenames
     chaz_dir = Path("/nfs/n2o/wcr/meilers/data/tracks/CHAZ/ERA-5")
@@ -26,19 +69,52 @@ def main(i_file):
     # Load CHAZ tracks (no year filtering for ERA5)
     tracks = TCTracks.from_simulations_chaz(fname)
 
-    # Load relevant centroids
-    cent = Centroids.from_hdf5(cent_file)
-    cent_tracks = cent.select(extent=tracks.get_extent(5))
+    # Slice tracks into chunks; each chunk only references its own track datasets
+    offsets = list(range(0, tracks.size, chunk_size))
+    chunks = [TCTracks(data=tracks.data[n:n+chunk_size]) for n in offsets]
+    out_files = [haz_dir / f"TC_global_0300as_CHAZ_ERA5_2ens00{i_file}_H08_{n}.hdf5" for n in offsets]
+
+    # Record every written chunk; with resume, skip the chunks that are already complete
+    manifest_file = haz_dir / f".manifest_CHAZ_ERA5_2ens00{i_file}_H08.json"
+    manifest = load_manifest(manifest_file)
+    fingerprints = {
+        out_file: input_fingerprint([fname, cent_file], offset=n, chunk_size=chunk_size, model='H08', time_step_h=.5)
+        for n, out_file in zip(offsets, out_files)
+    }
+    if resume:
+        todo = [i for i, out_file in enumerate(out_files)
+                if not is_complete(manifest, out_file, fingerprints[out_file])]
+        print(f"Resuming: {len(out_files) - len(todo)} of {len(out_files)} chunks already complete.")
+        chunks = [chunks[i] for i in todo]
+        out_files = [out_files[i] for i in todo]
 
     # Compute windfields in chunks
-    k = 1000
-    for n in range(0, tracks.size, k):
-        tracks_chunk = copy.deepcopy(tracks)
-        tracks_chunk.data = tracks.data[n:n+k]
-        tracks_chunk.equal_timestep(time_step_h=.5)
-        tc = TropCyclone.from_tracks(tracks_chunk, centroids=cent_tracks, model='H08')
-        out_name = f"TC_global_0300as_CHAZ_ERA5_2ens00{i_file}_H08_{n}.hdf5"
-        tc.write_hdf5(haz_dir / out_name)
+    if n_workers == 1:
+        for tracks_chunk, out_file in zip(chunks, out_files):
+            compute_chunk(tracks_chunk, cent_file, out_file)
+            record_output(manifest, manifest_file, out_file, fingerprints[out_file])
+        return
+
+    n_chunks = len(chunks)
+    if n_chunks == 0:
+        return
+    pool = Pool(nodes=min(n_workers, n_chunks))
+    print(f"Computing {n_chunks} chunks of {chunk_size} tracks on {pool.nodes} workers...")
+    try:
+        for out_file in pool.uimap(compute_chunk, chunks, [cent_file] * n_chunks, out_files):
+            record_output(manifest, manifest_file, out_file, fingerprints[out_file])
+            print(f"Saved {out_file}")
+    finally:
+        pool.close()
+        pool.join()
+        pool.clear()
 
 if __name__ == "__main__":
-    main(*sys.argv[1:])
+    parser = argparse.ArgumentParser(description="Compute CHAZ ERA5 windfields (H08) in parallel chunks.")
+    parser.add_argument("i_file", type=int, help="Ensemble index, e.g. 0..9")
+    parser.add_argument("--n_workers", type=int, default=None,
+                        help="Number of worker processes (default: cores of the node or SLURM allocation)")
+    parser.add_argument("--chunk_size", type=int, default=1000, help="Number of tracks per windfield chunk")
+    parser.add_argument("--resume", action="store_true", help="Skip chunks already completed by a previous run")
+    args = parser.parse_args()
+    main(args.i_file, args.n_workers, args.chunk_size, args.resume)
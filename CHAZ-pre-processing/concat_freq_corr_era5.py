@@ -9,80 +9,29 @@ import os
 import re
 import numpy as np
 from pathlib import Path
-from climada.hazard import TropCyclone
 from climada.util.constants import SYSTEM_DIR
 
-from shapely.geometry import Polygon, Point
+from preproc_utils import cached_basin_labels, load_hazard_files, partition_hazard_by_basin, write_freq_sidecar
+from preproc_utils import encode_event_ids, write_event_codes, stack_basin_hazards
 
 # ========== Setup ==========
 haz_dir = SYSTEM_DIR / "hazard" / "present"
 file_pattern = r'TC_global_0300as_CHAZ_ERA5_2ens00\d+_H08_\d+\.hdf5'
 
-# EP–NA boundary
-EP_NA_BOUNDARY_LINE = [
-    (-100.0, 60.0), (-100.0, 18.0), (-90.0, 18.0), (-90.0, 15.0),
-    (-85.0, 15.0), (-85.0, 9.0), (-75.0, 9.0), (-75.0, 5.0)
-]
-
-BASIN_BOUNDARIES = {
-    'EP': Polygon([(-180, 60), (-180, 5)] + EP_NA_BOUNDARY_LINE[::-1]),
-    'NA': Polygon(EP_NA_BOUNDARY_LINE + [(0, 5), (0, 60)]),
-    'NI': (30.0, 100.0, 5.0, 60.0),
-    'SI': (10.0, 135.0, -60.0, -5.0),
-    'SP': (135.0, -120.0, -60.0, -5.0),
-    'WP': (100.0, 180.0, 5.0, 60.0)
-}
-
 YRLY_FREQ_IB_LIT = {
     'EP': 14.5, 'NA': 10.8, 'NI': 2.0,
     'SI': 12.3, 'SP': 9.3, 'WP': 22.5
 }
 
-REGION_ID = {
-    'EP': 6000, 'NA': 6001, 'NI': 6002,
-    'SI': 6003, 'SP': 6004, 'WP': 6005
-}
-
 # ========== Functions ==========
 
-def is_polygon(geom):
-    return isinstance(geom, Polygon)
-
-def basin_split_haz(hazard, basin):
-    """Split TropCyclone hazard into given basin region."""
-    geom = BASIN_BOUNDARIES[basin]
-    region_id = REGION_ID[basin]
-
-    if is_polygon(geom):
-        basin_idx = np.array([
-            geom.contains(Point(lon, lat)) for lat, lon in hazard.centroids.coord
-        ])
-    else:
-        lonmin, lonmax, latmin, latmax = geom
-        if lonmax < lonmin:
-            basin_idx = (
-                (hazard.centroids.lat > latmin) &
-                (hazard.centroids.lat < latmax) &
-                ((hazard.centroids.lon > lonmin) | (hazard.centroids.lon < lonmax))
-            )
-        else:
-            basin_idx = (
-                (hazard.centroids.lat > latmin) &
-                (hazard.centroids.lat < latmax) &
-                (hazard.centroids.lon > lonmin) &
-                (hazard.centroids.lon < lonmax)
-            )
-
-    hazard.centroids.region_id[basin_idx] = region_id
-    return hazard.select(reg_id=region_id)
-
 def split_and_correct_basins(hazard):
     """Split hazard by basin, apply frequency correction."""
     basin_hazards = {}
     total_years = 15600  # 400 ensembles * 39 years each
+    labels = cached_basin_labels(hazard.centroids.lat, hazard.centroids.lon)
 
-    for bsn in BASIN_BOUNDARIES:
-        tc_haz_basin = basin_split_haz(hazard, bsn)
+    for bsn, tc_haz_basin in partition_hazard_by_basin(hazard, labels).items():
         num_tracks = tc_haz_basin.intensity.max(axis=1).getnnz()
         observed_freq = YRLY_FREQ_IB_LIT[bsn]
         simulated_freq = num_tracks / total_years
@@ -93,17 +42,16 @@ def split_and_correct_basins(hazard):
     return basin_hazards
 
 def rename_events_per_basin(hazards_dict):
-    """Give clean event IDs, names, and dates."""
+    """Give compact integer event IDs (see encode_event_ids) and dates."""
     basin_offsets = {
         'EP': 0, 'NA': 100000, 'NI': 200000,
         'SI': 300000, 'SP': 400000, 'WP': 500000
     }
 
+    encode_event_ids(hazards_dict)
     for basin, hazard in hazards_dict.items():
         n_ev = len(hazard.event_id)
         offset = basin_offsets[basin]
-        hazard.event_id = np.array([f"ev{i}_{basin}" for i in range(n_ev)])
-        hazard.event_name = [f"ev{i}_{basin}" for i in range(n_ev)]
         hazard.event_date = np.arange(offset, offset + n_ev)
 
 def save_basin_and_global_hazards(hazards_dict, out_dir):
@@ -113,29 +61,44 @@ def save_basin_and_global_hazards(hazards_dict, out_dir):
         hazard.write_hdf5(out_file)
 
     rename_events_per_basin(hazards_dict)
-    global_haz = TropCyclone.concat(list(hazards_dict.values()))
+    global_haz = stack_basin_hazards(hazards_dict)
     global_file = out_dir / f"TC_global_0300as_CHAZ_ERA5_freq-corr.hdf5"
     global_haz.write_hdf5(global_file)
+    write_event_codes(global_file, global_haz.event_id)
 
 # ========== Main ==========
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Concatenate and frequency correct CHAZ ERA5 windfields.")
+    parser.add_argument("--n_workers", type=int, default=None,
+                        help="Number of processes reading chunk files (default: all available cores)")
+    parser.add_argument("--write_intermediate", action="store_true",
+                        help="Also save the uncorrected TC_global_0300as_CHAZ_ERA5.hdf5")
+    parser.add_argument("--output_mode", choices=["full", "sidecar"], default="full",
+                        help="Write full basin/global hazards, or only a frequency sidecar referencing the chunk files")
+    args = parser.parse_args()
+
     # 1. Collect files
-    file_list = [f for f in os.listdir(haz_dir) if re.match(file_pattern, f)]
+    file_list = sorted(f for f in os.listdir(haz_dir) if re.match(file_pattern, f))
     print(f"Found {len(file_list)} hazard files to concatenate...")
 
-    # 2. Load and concatenate
-    all_haz = TropCyclone()
-    for fname in file_list:
-        all_haz.append(TropCyclone.from_hdf5(haz_dir / fname))
+    # 2. Load and concatenate in one go
+    all_haz = load_hazard_files([haz_dir / fname for fname in file_list], n_workers=args.n_workers)
 
-    # 3. Save intermediate full global file
-    all_haz.write_hdf5(haz_dir / "TC_global_0300as_CHAZ_ERA5.hdf5")
+    # 3. Optionally save intermediate full global file
+    if args.write_intermediate:
+        all_haz.write_hdf5(haz_dir / "TC_global_0300as_CHAZ_ERA5.hdf5")
 
     # 4. Split and correct
     basin_hazards = split_and_correct_basins(all_haz)
 
     # 5. Save outputs
-    save_basin_and_global_hazards(basin_hazards, haz_dir)
+    if args.output_mode == "sidecar":
+        write_freq_sidecar(haz_dir / "TC_global_0300as_CHAZ_ERA5_freq-corr_sidecar.hdf5",
+                           basin_hazards, [haz_dir / fname for fname in file_list], YRLY_FREQ_IB_LIT)
+    else:
+        save_basin_and_global_hazards(basin_hazards, haz_dir)
 
     print("Finished processing CHAZ ERA5 hazard data.")
@@ -6,25 +6,19 @@ Script for CHAZ hazard frequency correction and basin-wise processing.
 
 import os
 import re
+import itertools
 import numpy as np
 from pathlib import Path
-from shapely.geometry import Polygon, Point
 
-from climada.hazard import Centroids, TropCyclone
+from climada.hazard import Centroids
 from climada.util.constants import SYSTEM_DIR
 from climada.util.coordinates import lon_normalize
+from pathos.pools import ProcessPool as Pool
 
-# Define EP–NA boundary
-EP_NA_BOUNDARY_LINE = [
-    (-100.0, 60.0),
-    (-100.0, 18.0),
-    (-90.0, 18.0),
-    (-90.0, 15.0),
-    (-85.0, 15.0),
-    (-85.0, 9.0),
-    (-75.0, 9.0),
-    (-75.0, 5.0)
-]
+from preproc_utils import BASIN_BOUNDARIES, cached_basin_labels, partition_hazard_by_basin, write_freq_sidecar
+from preproc_utils import input_fingerprint, load_manifest, is_complete, record_output
+from preproc_utils import available_memory_gb, default_n_workers, load_hazard_files
+from preproc_utils import encode_event_ids, write_event_codes, stack_basin_hazards
 
 # Define constants
 YRLY_FREQ_IB_LIT = {
@@ -32,74 +26,41 @@ YRLY_FREQ_IB_LIT = {
     'SI': 12.3, 'SP': 9.3, 'WP': 22.5
 }
 
-BASIN_BOUNDARIES = {
-    'EP': Polygon([(-180, 60), (-180, 5)] + EP_NA_BOUNDARY_LINE[::-1]),
-    'NA': Polygon(EP_NA_BOUNDARY_LINE + [(0, 5), (0, 60)]),
-    'NI': (30.0, 100.0, 5.0, 60.0),
-    'SI': (10.0, 135.0, -60.0, -5.0),
-    'SP': (135.0, -120.0, -60.0, -5.0),
-    'WP': (100.0, 180.0, 5.0, 60.0)
-}
-
-REGION_ID = {
-    'EP': 6000, 'NA': 6001, 'NI': 6002,
-    'SI': 6003, 'SP': 6004, 'WP': 6005
-}
 
+def chaz_files(haz_in, model, scenario, period, cat, wind):
+    """CHAZ hazard files of the four input basins."""
+    return [
+        haz_in / f'TC_{basin}_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5'
+        for basin in ['AP', 'IO', 'SH', 'WP']
+    ]
 
-def is_polygon(basin_geom):
-    return isinstance(basin_geom, Polygon)
-
-
-def load_chaz_files(haz_in, model, scenario, period, cat, wind):
-    """Load and concatenate CHAZ hazard files from four input basins into a single TropCyclone object."""
-    haz_list = []
-    for basin in ['AP', 'IO', 'SH', 'WP']:
-        file = f'TC_{basin}_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5'
-        tc_hazard = TropCyclone.from_hdf5(haz_in / file)
-        haz_list.append(tc_hazard)
-    
-    return TropCyclone.concat(haz_list)
 
+def output_files(haz_out, model, scenario, period, cat, wind, output_mode='full'):
+    """Per-basin and global output files of one period, or its frequency sidecar file."""
+    if output_mode == 'sidecar':
+        return {'sidecar': haz_out / f"TC_global_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}_sidecar.hdf5"}
+    out_files = {
+        bsn: haz_out / f"TC_{bsn}_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5"
+        for bsn in BASIN_BOUNDARIES
+    }
+    out_files['global'] = haz_out / f"TC_global_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5"
+    return out_files
 
-def basin_split_haz(hazard, basin):
-    """Split global TropCyclone hazard into basin using polygons or bounding boxes."""
-    geom = BASIN_BOUNDARIES[basin]
-    region_id = REGION_ID[basin]
 
-    if is_polygon(geom):
-        # Polygon mask
-        basin_idx = np.array([
-            geom.contains(Point(lon, lat)) for lat, lon in hazard.centroids.coord
-        ])
-    else:
-        # Rectangular bounding box (handle dateline wrap)
-        lonmin, lonmax, latmin, latmax = geom
-        if lonmax < lonmin:
-            # Basin crosses dateline (e.g. SP)
-            basin_idx = (
-                (hazard.centroids.lat > latmin) &
-                (hazard.centroids.lat < latmax) &
-                ((hazard.centroids.lon > lonmin) | (hazard.centroids.lon < lonmax))
-            )
-        else:
-            basin_idx = (
-                (hazard.centroids.lat > latmin) &
-                (hazard.centroids.lat < latmax) &
-                (hazard.centroids.lon > lonmin) &
-                (hazard.centroids.lon < lonmax)
-            )
-
-    hazard.centroids.region_id[basin_idx] = region_id
-    return hazard.select(reg_id=region_id)
+def load_chaz_files(haz_in, model, scenario, period, cat, wind, n_workers=4):
+    """
+    Load and concatenate CHAZ hazard files from four input basins into a single TropCyclone object.
+    The four files are read in parallel on n_workers processes.
+    """
+    return load_hazard_files(chaz_files(haz_in, model, scenario, period, cat, wind), n_workers=n_workers)
 
 
 def split_and_correct_basins(hazard, period, model, scenario, cat, wind, base_freq_per_basin=None):
     """Split hazard by basin, apply frequency correction or assign base frequency."""
     basin_hazards = {}
+    labels = cached_basin_labels(hazard.centroids.lat, hazard.centroids.lon)
 
-    for bsn in BASIN_BOUNDARIES:
-        tc_haz_basin = basin_split_haz(hazard, bsn)
+    for bsn, tc_haz_basin in partition_hazard_by_basin(hazard, labels).items():
 
         if period == 'base':
             num_tracks = tc_haz_basin.intensity.max(axis=1).getnnz()
@@ -117,8 +78,8 @@ def split_and_correct_basins(hazard, period, model, scenario, cat, wind, base_fr
     return basin_hazards
 
 
-def rename_events_per_basin(hazards_dict, model, cat):
-    """Assign clean, unique names and dates to each event per basin."""
+def rename_events_per_basin(hazards_dict):
+    """Assign compact, unique integer IDs (see encode_event_ids) and dates to each event per basin."""
 
     basin_offsets = {
         'EP': 0,
@@ -129,57 +90,141 @@ def rename_events_per_basin(hazards_dict, model, cat):
         'WP': 500000
     }
 
+    encode_event_ids(hazards_dict)
     for basin, hazard in hazards_dict.items():
         n_ev = len(hazard.event_id)
         offset = basin_offsets[basin]
 
-        hazard.event_id = np.array([f"{model}_{cat}_ev{i}_{basin}" for i in range(n_ev)])
-        hazard.event_name = [f"{model}_{cat}_ev{i}_{basin}" for i in range(n_ev)]
         hazard.event_date = np.arange(offset, offset + n_ev)
 
 
 def save_basin_and_global_hazards(hazards_dict, haz_out, model, scenario, period, cat, wind):
     """Save each basin hazard and concatenate into a global hazard object."""
+    out_files = output_files(haz_out, model, scenario, period, cat, wind)
     
     # Save each basin hazard to file
     for bsn, hazard in hazards_dict.items():
-        out_file = haz_out / f"TC_{bsn}_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5"
-        hazard.write_hdf5(out_file)
+        hazard.write_hdf5(out_files[bsn])
     
     # Rename events before concatenation
-    rename_events_per_basin(hazards_dict, model, cat)
+    rename_events_per_basin(hazards_dict)
 
     # Concatenate all basin hazards into one global object
-    global_haz = TropCyclone.concat(list(hazards_dict.values()))
-    global_file = haz_out / f"TC_global_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5"
-    global_haz.write_hdf5(global_file)
+    global_haz = stack_basin_hazards(hazards_dict)
+    global_haz.write_hdf5(out_files['global'])
+    write_event_codes(out_files['global'], global_haz.event_id, model, cat)
+
+
+def run_period(haz_in, haz_out, model, scenario, cat, wind, period, base_freq_per_basin=None,
+               resume=False, output_mode='full', n_workers=4):
+    """
+    Frequency correct one period of a model/scenario/TCGI combination and save the outputs.
+    Future periods use the base frequency per basin of the baseline. Returns the base frequency per basin.
+    """
+    base_freq_per_basin = {} if period == 'base' else base_freq_per_basin
+
+    # Record every written output; with resume, skip the period if its outputs are all complete
+    manifest_file = haz_out / f".manifest_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.json"
+    manifest = load_manifest(manifest_file)
+
+    in_files = chaz_files(haz_in, model, scenario, period, cat, wind)
+    out_files = output_files(haz_out, model, scenario, period, cat, wind, output_mode)
+    fingerprint = input_fingerprint(
+        in_files, period=period, yrly_freq=YRLY_FREQ_IB_LIT, output_mode=output_mode,
+        base_freq=None if period == 'base' else base_freq_per_basin
+    )
+
+    if resume and all(is_complete(manifest, f, fingerprint) for f in out_files.values()):
+        if period == 'base':
+            base_freq_per_basin.update(manifest[next(iter(out_files.values())).name]['base_freq'])
+        print(f"Skipping {model} {scenario} {cat} {period}: all outputs complete.")
+        return base_freq_per_basin
+
+    chaz_haz = load_chaz_files(haz_in, model, scenario, period, cat, wind, n_workers)
+    hazards = split_and_correct_basins(chaz_haz, period, model, scenario, cat, wind, base_freq_per_basin)
+    if output_mode == 'sidecar':
+        write_freq_sidecar(out_files['sidecar'], hazards, in_files, YRLY_FREQ_IB_LIT, model, cat)
+    else:
+        save_basin_and_global_hazards(hazards, haz_out, model, scenario, period, cat, wind)
+    for out_file in out_files.values():
+        record_output(manifest, manifest_file, out_file, fingerprint, base_freq=base_freq_per_basin)
+
+    return base_freq_per_basin
 
 
-def main(model, scenario, cat, wind):
+def main(model, scenario, cat, wind, resume=False, output_mode='full'):
     haz_in = Path("/nfs/n2o/wcr/meilers/data/hazard/future/CHAZ")
     haz_out = Path("/nfs/n2o/wcr/meilers/data/hazard/future/CHAZ-update")
 
-    base_freq_per_basin = {}
-
     # Step 1: Baseline
-    chaz_base = load_chaz_files(haz_in, model, scenario, "base", cat, wind)
-    base_hazards = split_and_correct_basins(chaz_base, "base", model, scenario, cat, wind, base_freq_per_basin)
-    save_basin_and_global_hazards(base_hazards, haz_out, model, scenario, "base", cat, wind)
+    base_freq_per_basin = run_period(haz_in, haz_out, model, scenario, cat, wind, 'base',
+                                     resume=resume, output_mode=output_mode)
 
     # Step 2 & 3: Future periods
     for period in ['fut1', 'fut2']:
-        chaz_fut = load_chaz_files(haz_in, model, scenario, period, cat, wind)
-        fut_hazards = split_and_correct_basins(chaz_fut, period, model, scenario, cat, wind, base_freq_per_basin)
-        save_basin_and_global_hazards(fut_hazards, haz_out, model, scenario, period, cat, wind)
+        run_period(haz_in, haz_out, model, scenario, cat, wind, period, base_freq_per_basin,
+                   resume=resume, output_mode=output_mode)
+
+
+def run_batch(models, scenarios, cats, wind, resume=False, output_mode='full', n_jobs=None, mem_per_job=64):
+    """
+    Run the frequency correction for all combinations of models, scenarios and TCGIs on a process pool.
+
+    The number of concurrent jobs is limited by the available cores and by the available memory
+    divided by mem_per_job (GB, peak memory of one period). Each combination's baseline runs first;
+    as soon as it finishes, its base frequency per basin is handed to its fut1 and fut2 jobs.
+    """
+    haz_in = Path("/nfs/n2o/wcr/meilers/data/hazard/future/CHAZ")
+    haz_out = Path("/nfs/n2o/wcr/meilers/data/hazard/future/CHAZ-update")
+
+    combos = list(itertools.product(models, scenarios, cats))
+    n_jobs = min(n_jobs or default_n_workers(), int(available_memory_gb() // mem_per_job), 2 * len(combos))
+    n_jobs = max(n_jobs, 1)
+    print(f"Running {len(combos)} model/scenario/TCGI combinations with {n_jobs} concurrent jobs...")
+
+    def run_base(combo):
+        model, scenario, cat = combo
+        base_freq = run_period(haz_in, haz_out, model, scenario, cat, wind, 'base',
+                               resume=resume, output_mode=output_mode, n_workers=1)
+        return combo, base_freq
+
+    pool = Pool(nodes=n_jobs)
+    try:
+        fut_jobs = []
+        for (model, scenario, cat), base_freq in pool.uimap(run_base, combos):
+            print(f"Finished {model} {scenario} {cat} base, queuing future periods.")
+            for period in ['fut1', 'fut2']:
+                fut_jobs.append(pool.apipe(
+                    run_period, haz_in, haz_out, model, scenario, cat, wind, period, base_freq,
+                    resume, output_mode, 1
+                ))
+        for job in fut_jobs:
+            job.get()
+    finally:
+        pool.close()
+        pool.join()
+        pool.clear()
 
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser(description="Run CHAZ frequency correction pipeline.")
-    parser.add_argument("--model", type=str, required=True, help="Model name, e.g. CESM2")
-    parser.add_argument("--scenario", type=str, required=True, help="Scenario, e.g. ssp370")
-    parser.add_argument("--cat", type=str, required=True, help="TCGI, e.g. CRH")
+    parser.add_argument("--model", type=str, nargs="+", required=True, help="Model name(s), e.g. CESM2")
+    parser.add_argument("--scenario", type=str, nargs="+", required=True, help="Scenario(s), e.g. ssp370")
+    parser.add_argument("--cat", type=str, nargs="+", required=True, help="TCGI(s), e.g. CRH")
     parser.add_argument("--wind", type=str, required=True, help="Wind model, e.g. H08")
+    parser.add_argument("--resume", action="store_true", help="Skip periods already completed by a previous run")
+    parser.add_argument("--output_mode", choices=["full", "sidecar"], default="full",
+                        help="Write full basin/global hazards, or only a frequency sidecar referencing the inputs")
+
+    parser.add_argument("--n_jobs", type=int, default=None,
+                        help="Maximum concurrent jobs when several combinations are given (default: available cores)")
+    parser.add_argument("--mem_per_job", type=float, default=64,
+                        help="Peak memory of one job in GB, limits the concurrent jobs to the available memory")
 
     args = parser.parse_args()
-    main(args.model, args.scenario, args.cat, args.wind)
+    if len(args.model) * len(args.scenario) * len(args.cat) == 1:
+        main(args.model[0], args.scenario[0], args.cat[0], args.wind, args.resume, args.output_mode)
+    else:
+        run_batch(args.model, args.scenario, args.cat, args.wind, args.resume, args.output_mode,
+                  args.n_jobs, args.mem_per_job)
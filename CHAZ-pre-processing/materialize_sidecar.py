@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Write the frequency corrected hazards described by frequency sidecar files (output_mode 'sidecar' of
+freq_corr.py and concat_freq_corr_era5.py) as full basin and global hazard files for the map scripts,
+optionally with the frequency correction redone for new observed yearly frequencies per basin. The
+sidecar files themselves are never modified.
+"""
+
+import json
+from pathlib import Path
+
+from preproc_utils import materialize_freq_sidecar
+
+
+def main(sidecar_files, out_dir=None, yrly_freq=None, global_only=False, n_workers=None):
+    for sidecar_file in sidecar_files:
+        materialize_freq_sidecar(sidecar_file, out_dir, write_basins=not global_only, n_workers=n_workers,
+                                 yrly_freq=yrly_freq)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Materialize frequency sidecar files as full hazard files.")
+    parser.add_argument("sidecar_files", type=Path, nargs="+", help="Sidecar files (*_sidecar.hdf5)")
+    parser.add_argument("--out_dir", type=Path, default=None, help="Output directory (default: next to each sidecar)")
+    parser.add_argument("--yrly_freq", type=json.loads, default=None,
+                        help='Redo the correction for new observed yearly frequencies, e.g. \'{"EP": 14.5, ...}\'')
+    parser.add_argument("--global_only", action="store_true", help="Only write the global hazard files")
+    parser.add_argument("--n_workers", type=int, default=None,
+                        help="Number of processes reading source files (default: all available cores)")
+    args = parser.parse_args()
+    main(args.sidecar_files, args.out_dir, args.yrly_freq, args.global_only, args.n_workers)
@@ -0,0 +1,573 @@
+# preproc_utils.py
+"""
+Shared helpers for the CHAZ pre-processing scripts.
+"""
+
+import os
+import copy
+import json
+import shutil
+import hashlib
+import itertools
+import h5py
+import numpy as np
+import pandas as pd
+import shapely
+from pathlib import Path
+from scipy import sparse
+from shapely.geometry import Polygon
+from pathos.pools import ProcessPool as Pool
+
+from climada.hazard import Centroids, TropCyclone
+from climada.util.constants import SYSTEM_DIR
+
+# Define EP–NA boundary
+EP_NA_BOUNDARY_LINE = [
+    (-100.0, 60.0),
+    (-100.0, 18.0),
+    (-90.0, 18.0),
+    (-90.0, 15.0),
+    (-85.0, 15.0),
+    (-85.0, 9.0),
+    (-75.0, 9.0),
+    (-75.0, 5.0)
+]
+
+BASIN_BOUNDARIES = {
+    'EP': Polygon([(-180, 60), (-180, 5)] + EP_NA_BOUNDARY_LINE[::-1]),
+    'NA': Polygon(EP_NA_BOUNDARY_LINE + [(0, 5), (0, 60)]),
+    'NI': (30.0, 100.0, 5.0, 60.0),
+    'SI': (10.0, 135.0, -60.0, -5.0),
+    'SP': (135.0, -120.0, -60.0, -5.0),
+    'WP': (100.0, 180.0, 5.0, 60.0)
+}
+
+REGION_ID = {
+    'EP': 6000, 'NA': 6001, 'NI': 6002,
+    'SI': 6003, 'SP': 6004, 'WP': 6005
+}
+
+# Unique integer event IDs across basins: basin label * EVENT_ID_STRIDE + event index within basin
+EVENT_ID_STRIDE = 10**7
+
+# Basin labels are cached per centroid set, on disk and per process
+BASIN_LABELS_DIR = SYSTEM_DIR / "hazard" / "basin_labels"
+_BASIN_LABELS = {}
+
+
+def default_n_workers():
+    """Number of cores available to the job: SLURM allocation if set, else all cores of the node."""
+    return int(os.environ.get("SLURM_CPUS_PER_TASK", os.cpu_count() or 1))
+
+
+def available_memory_gb():
+    """Memory available to the job in GB: SLURM allocation if set, else the available memory of the node."""
+    if "SLURM_MEM_PER_NODE" in os.environ:
+        return int(os.environ["SLURM_MEM_PER_NODE"]) / 1024
+    if "SLURM_MEM_PER_CPU" in os.environ:
+        return int(os.environ["SLURM_MEM_PER_CPU"]) * default_n_workers() / 1024
+    return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1024**3
+
+
+def input_fingerprint(in_files, **params):
+    """
+    Fingerprint the inputs of an output file from the input files (path, size, modification time)
+    and the processing parameters passed as keyword arguments.
+    """
+    sha = hashlib.sha1()
+    for in_file in in_files:
+        stat = os.stat(in_file)
+        sha.update(f"{Path(in_file).resolve()}|{stat.st_size}|{stat.st_mtime_ns}\n".encode())
+    sha.update(json.dumps(params, sort_keys=True, default=str).encode())
+    return sha.hexdigest()
+
+
+def load_manifest(manifest_file):
+    """Load the manifest of completed outputs, or an empty one if it does not exist yet."""
+    manifest_file = Path(manifest_file)
+    if not manifest_file.exists():
+        return {}
+    with open(manifest_file) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_file):
+    """Write the manifest atomically so that a killed job never leaves it truncated."""
+    tmp_file = Path(f"{manifest_file}.tmp")
+    with open(tmp_file, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_file, manifest_file)
+
+
+def is_complete(manifest, out_file, fingerprint):
+    """
+    Check whether out_file was recorded with the given input fingerprint and is unchanged on disk
+    since (same size and modification time). Partially written files are never recorded.
+    """
+    entry = manifest.get(Path(out_file).name)
+    if entry is None or entry["fingerprint"] != fingerprint:
+        return False
+    try:
+        stat = os.stat(out_file)
+    except FileNotFoundError:
+        return False
+    return stat.st_size == entry["size"] and stat.st_mtime_ns == entry["mtime_ns"]
+
+
+def record_output(manifest, manifest_file, out_file, fingerprint, **meta):
+    """Record a completed output file with its input fingerprint and optional metadata."""
+    stat = os.stat(out_file)
+    manifest[Path(out_file).name] = {
+        "fingerprint": fingerprint,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+        **meta
+    }
+    save_manifest(manifest, manifest_file)
+
+
+def is_polygon(basin_geom):
+    return isinstance(basin_geom, Polygon)
+
+
+def basin_labels(lat, lon):
+    """
+    Label every centroid with the position of its basin in BASIN_BOUNDARIES, or -1 outside all basins.
+
+    Polygons are tested with vectorized point-in-polygon on the prepared geometry, restricted to the
+    points within the polygon bounds. Bounding boxes are tested with array comparisons, handling
+    basins that cross the dateline (e.g. SP).
+    """
+    lat = np.asarray(lat)
+    lon = np.asarray(lon)
+    labels = np.full(lat.shape, -1, dtype=np.int8)
+
+    for i_bsn, geom in enumerate(BASIN_BOUNDARIES.values()):
+        if is_polygon(geom):
+            shapely.prepare(geom)
+            lonmin, latmin, lonmax, latmax = geom.bounds
+            cand = np.flatnonzero((lat > latmin) & (lat < latmax) & (lon > lonmin) & (lon < lonmax))
+            basin_idx = np.zeros(lat.shape, dtype=bool)
+            basin_idx[cand] = shapely.contains_xy(geom, lon[cand], lat[cand])
+        else:
+            lonmin, lonmax, latmin, latmax = geom
+            if lonmax < lonmin:
+                # Basin crosses dateline (e.g. SP)
+                basin_idx = (
+                    (lat > latmin) & (lat < latmax) &
+                    ((lon > lonmin) | (lon < lonmax))
+                )
+            else:
+                basin_idx = (
+                    (lat > latmin) & (lat < latmax) &
+                    (lon > lonmin) & (lon < lonmax)
+                )
+        labels[basin_idx] = i_bsn
+
+    return labels
+
+
+def basin_labels_key(lat, lon):
+    """Hash of the centroid coordinates and the basin definitions, identifying a basin label array."""
+    sha = hashlib.sha1()
+    sha.update(np.ascontiguousarray(lat, dtype=np.float64).tobytes())
+    sha.update(np.ascontiguousarray(lon, dtype=np.float64).tobytes())
+    sha.update(str([
+        (bsn, geom.wkt if is_polygon(geom) else geom) for bsn, geom in BASIN_BOUNDARIES.items()
+    ]).encode())
+    return sha.hexdigest()
+
+
+def cached_basin_labels(lat, lon, cache_dir=None):
+    """
+    Basin labels of the centroids (see basin_labels), computed once per centroid set and stored
+    in cache_dir (default: BASIN_LABELS_DIR) as basin_labels_<hash>.npy.
+    """
+    key = basin_labels_key(lat, lon)
+    if key in _BASIN_LABELS:
+        return _BASIN_LABELS[key]
+
+    cache_dir = Path(cache_dir or BASIN_LABELS_DIR)
+    cache_file = cache_dir / f"basin_labels_{key[:16]}.npy"
+    if cache_file.exists():
+        labels = np.load(cache_file)
+    else:
+        labels = basin_labels(lat, lon)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_file = cache_dir / f"basin_labels_{key[:16]}.{os.getpid()}.tmp.npy"
+        np.save(tmp_file, labels)
+        os.replace(tmp_file, cache_file)
+
+    if labels.shape != np.shape(lat):
+        raise ValueError(f"Cached basin labels {cache_file} do not match the centroids.")
+    _BASIN_LABELS[key] = labels
+    return labels
+
+
+def partition_csr(mat, labels, n_labels):
+    """
+    Split the columns of a sparse matrix by centroid label in a single pass over its entries.
+
+    Returns one CSR matrix per label 0..n_labels-1, holding the columns of the centroids with that
+    label in their original order. Columns labelled -1 are dropped.
+    """
+    mat = sparse.csr_matrix(mat)
+    n_rows = mat.shape[0]
+    labels = np.asarray(labels)
+
+    # Column index of each centroid within its own label
+    n_cols = np.bincount(labels[labels >= 0], minlength=n_labels)
+    local_idx = np.zeros(labels.size, dtype=mat.indices.dtype)
+    for lab in range(n_labels):
+        local_idx[labels == lab] = np.arange(n_cols[lab])
+
+    # Stable sort by label keeps the row-major order of the entries within each label
+    entry_lab = labels[mat.indices]
+    order = np.argsort(entry_lab, kind='stable')
+    bounds = np.searchsorted(entry_lab[order], np.arange(n_labels + 1))
+
+    rows = np.repeat(np.arange(n_rows), np.diff(mat.indptr))
+    keep = entry_lab >= 0
+    row_counts = np.bincount(
+        entry_lab[keep].astype(np.int64) * n_rows + rows[keep], minlength=n_labels * n_rows
+    ).reshape(n_labels, n_rows)
+
+    parts = []
+    for lab in range(n_labels):
+        sel = order[bounds[lab]:bounds[lab + 1]]
+        indptr = np.concatenate([[0], np.cumsum(row_counts[lab])])
+        parts.append(sparse.csr_matrix(
+            (mat.data[sel], local_idx[mat.indices[sel]], indptr), shape=(n_rows, n_cols[lab])
+        ))
+    return parts
+
+
+def partition_hazard_by_basin(hazard, labels):
+    """
+    Split a hazard into one hazard per basin of BASIN_BOUNDARIES, given the basin label of each
+    centroid. Intensity and fraction are partitioned in one pass each; all events are kept in every
+    basin, as with hazard.select(reg_id=...).
+    """
+    n_bsn = len(BASIN_BOUNDARIES)
+    intensity = partition_csr(hazard.intensity, labels, n_bsn)
+    fraction = partition_csr(hazard.fraction, labels, n_bsn)
+
+    basin_hazards = {}
+    for i_bsn, bsn in enumerate(BASIN_BOUNDARIES):
+        haz_basin = copy.copy(hazard)
+        for attr, value in vars(hazard).items():
+            if isinstance(value, (np.ndarray, list)):
+                setattr(haz_basin, attr, copy.copy(value))
+        haz_basin.centroids = hazard.centroids.select(sel_cen=labels == i_bsn)
+        haz_basin.centroids.region_id = np.full(haz_basin.centroids.size, REGION_ID[bsn])
+        haz_basin.intensity = intensity[i_bsn]
+        haz_basin.fraction = fraction[i_bsn]
+        basin_hazards[bsn] = haz_basin
+
+    return basin_hazards
+
+
+def centroids_hash(lat, lon):
+    """Hash of the centroid coordinates."""
+    sha = hashlib.sha1()
+    sha.update(np.ascontiguousarray(lat, dtype=np.float64).tobytes())
+    sha.update(np.ascontiguousarray(lon, dtype=np.float64).tobytes())
+    return sha.hexdigest()
+
+
+def _read_events(file):
+    """Read a hazard file and return it without centroids, together with the hash of its centroids."""
+    hazard = TropCyclone.from_hdf5(file)
+    cent_key = centroids_hash(hazard.centroids.lat, hazard.centroids.lon)
+    hazard.centroids = None
+    return hazard, cent_key
+
+
+def stack_hazards(haz_list, centroids, block_diagonal=False):
+    """
+    Stack the events of hazards defined on the same centroids into one hazard. Sparse matrices are
+    combined with a single vstack, event-wise arrays and lists are concatenated. With block_diagonal,
+    the hazards are on disjoint centroid sets, given one after the other in centroids, and the sparse
+    matrices are combined block-diagonally.
+    """
+    hazard = copy.copy(haz_list[0])
+    n_events = [haz.size for haz in haz_list]
+    for attr, value in vars(haz_list[0]).items():
+        values = [getattr(haz, attr) for haz in haz_list]
+        if sparse.issparse(value):
+            stack = sparse.block_diag if block_diagonal else sparse.vstack
+            setattr(hazard, attr, stack(values, format='csr'))
+        elif isinstance(value, np.ndarray) and value.ndim > 0 and \
+                all(val.shape[0] == n_ev for val, n_ev in zip(values, n_events)):
+            setattr(hazard, attr, np.concatenate(values))
+        elif isinstance(value, list) and all(len(val) == n_ev for val, n_ev in zip(values, n_events)):
+            setattr(hazard, attr, list(itertools.chain.from_iterable(values)))
+
+    hazard.centroids = centroids
+    hazard.sanitize_event_ids()
+    return hazard
+
+
+def stack_basin_hazards(hazards_dict):
+    """
+    Combine basin hazards on disjoint centroid sets (see partition_hazard_by_basin) into the global hazard:
+    the centroids of all basins in order, the events of one basin after the other and block-diagonal
+    intensity and fraction, as TropCyclone.concat would give. Unlike concat, which checks the hazard and
+    fills empty event names with the integer event IDs that write_hdf5 rejects, empty event names (see
+    encode_event_ids) stay empty, so no per-event name column is written.
+    """
+    haz_list = list(hazards_dict.values())
+    gdf = pd.concat([haz.centroids.gdf for haz in haz_list], ignore_index=True)
+    return stack_hazards(haz_list, Centroids.from_geodataframe(gdf), block_diagonal=True)
+
+
+def load_hazard_files(files, n_workers=None):
+    """
+    Load hazard files and combine their events into a single TropCyclone.
+
+    Files are read in parallel on n_workers processes (default: all available cores). If all files
+    share the same centroids, as the windfield chunks of compute_era5_windfields.py do, the
+    intensity and fraction matrices are built with a single vstack. Otherwise the loaded hazards get
+    their centroids back (read once per distinct centroid set) and are combined with TropCyclone.concat.
+    """
+    files = list(files)
+    n_workers = min(n_workers or default_n_workers(), len(files))
+
+    if n_workers > 1:
+        pool = Pool(nodes=n_workers)
+        try:
+            results = pool.map(_read_events, files)
+        finally:
+            pool.close()
+            pool.join()
+            pool.clear()
+    else:
+        results = [_read_events(file) for file in files]
+
+    haz_list, cent_keys = zip(*results)
+    if len(set(cent_keys)) > 1:
+        print("Hazard files have different centroids, falling back to TropCyclone.concat.")
+        centroids = {}
+        for hazard, file, cent_key in zip(haz_list, files, cent_keys):
+            if cent_key not in centroids:
+                centroids[cent_key] = Centroids.from_hdf5(file)
+            hazard.centroids = centroids[cent_key]
+        return TropCyclone.concat(list(haz_list))
+
+    centroids = Centroids.from_hdf5(files[0])
+    return stack_hazards(list(haz_list), centroids)
+
+
+def take_events(hazard, idx):
+    """Return a hazard with the events at positions idx, keeping all centroids."""
+    haz_sel = copy.copy(hazard)
+    n_events = hazard.size
+    for attr, value in vars(hazard).items():
+        if sparse.issparse(value) and value.shape[0] == n_events:
+            setattr(haz_sel, attr, sparse.csr_matrix(value)[idx])
+        elif isinstance(value, np.ndarray) and value.ndim > 0 and value.shape[0] == n_events:
+            setattr(haz_sel, attr, value[idx])
+        elif isinstance(value, list) and len(value) == n_events:
+            setattr(haz_sel, attr, [value[i] for i in idx])
+    return haz_sel
+
+
+def write_freq_sidecar(sidecar_file, hazards_dict, source_files, yrly_freq, model=None, cat=None):
+    """
+    Write the frequency correction of the basin hazards to a small sidecar file instead of the
+    full per-basin and global hazards.
+
+    The sidecar holds one row per event and basin, in the order of the global hazard: the event
+    index in the (stacked) source files, the basin label, the corrected frequency and the event ID
+    (see encode_event_ids). The source files, the yearly observed frequencies used for the correction
+    and the model and TCGI of the event names are stored as attributes. See load_freq_sidecar and
+    update_sidecar_frequency. A written sidecar is never modified in place, as the resume manifest of
+    freq_corr.py identifies it by size and modification time.
+    """
+    basins = list(BASIN_BOUNDARIES)
+    event_index, basin, frequency = [], [], []
+    for bsn, hazard in hazards_dict.items():
+        event_index.append(np.arange(hazard.size, dtype=np.int32))
+        basin.append(np.full(hazard.size, basins.index(bsn), dtype=np.int8))
+        frequency.append(np.asarray(hazard.frequency, dtype=np.float64))
+    event_index = np.concatenate(event_index)
+    basin = np.concatenate(basin)
+
+    with h5py.File(sidecar_file, 'w') as f:
+        f.create_dataset('event_index', data=event_index, compression='gzip')
+        f.create_dataset('basin', data=basin, compression='gzip')
+        f.create_dataset('frequency', data=np.concatenate(frequency), compression='gzip')
+        f.create_dataset('event_id', data=basin.astype(np.int64) * EVENT_ID_STRIDE + event_index,
+                         compression='gzip')
+        f.attrs['source_files'] = [str(file) for file in source_files]
+        f.attrs['basins'] = basins
+        f.attrs['yrly_freq'] = json.dumps(yrly_freq)
+        f.attrs['model'] = model or ""
+        f.attrs['cat'] = cat or ""
+    print(f"Saved frequency sidecar to {sidecar_file}")
+
+
+def rescale_sidecar_frequency(frequency, basin, basins, old_yrly_freq, yrly_freq):
+    """
+    Redo the frequency correction of sidecar rows for new yearly observed frequencies per basin. The
+    corrected frequency is proportional to the observed one, so the frequencies are rescaled.
+    """
+    scale = np.array([yrly_freq[bsn] / old_yrly_freq[bsn] for bsn in basins])
+    return frequency * scale[basin]
+
+
+def load_freq_sidecar_basins(sidecar_file, basins=None, n_workers=None, yrly_freq=None):
+    """
+    Build the frequency corrected basin hazards described by a sidecar file written by write_freq_sidecar,
+    as a dict basin -> hazard in the order of the global hazard (all basins with basins=None).
+
+    The source files are loaded with load_hazard_files, split into basins with the cached basin
+    labels, and the sidecar frequencies and integer event IDs are applied. With yrly_freq, the
+    frequencies are first rescaled to these yearly observed frequencies per basin; the sidecar file
+    itself is left unchanged. Event names are left empty; use event_names with the model and TCGI
+    attributes of the sidecar to reconstruct them.
+    """
+    with h5py.File(sidecar_file, 'r') as f:
+        source_files = list(f.attrs['source_files'])
+        sidecar_basins = list(f.attrs['basins'])
+        event_index = f['event_index'][:]
+        basin = f['basin'][:]
+        frequency = f['frequency'][:]
+        event_id = f['event_id'][:]
+        if yrly_freq:
+            frequency = rescale_sidecar_frequency(
+                frequency, basin, sidecar_basins, json.loads(f.attrs['yrly_freq']), yrly_freq)
+
+    hazard = load_hazard_files(source_files, n_workers=n_workers)
+    labels = cached_basin_labels(hazard.centroids.lat, hazard.centroids.lon)
+    basin_hazards = partition_hazard_by_basin(hazard, labels)
+
+    parts = {}
+    for bsn, haz_basin in basin_hazards.items():
+        if basins is not None and bsn not in basins:
+            continue
+        bsn_rows = np.flatnonzero(basin == sidecar_basins.index(bsn))
+        haz_basin = take_events(haz_basin, event_index[bsn_rows])
+        haz_basin.frequency = frequency[bsn_rows]
+        haz_basin.event_id = event_id[bsn_rows]
+        haz_basin.event_name = []
+        parts[bsn] = haz_basin
+    return parts
+
+
+def load_freq_sidecar(sidecar_file, basins=None, n_workers=None, yrly_freq=None):
+    """
+    Build the frequency corrected hazard described by a sidecar file written by write_freq_sidecar.
+    With basins=None the global hazard is returned (same events as the former global file), otherwise
+    only the given basins, e.g. basins=['NA'] for the former per-basin file. See load_freq_sidecar_basins
+    and stack_basin_hazards.
+    """
+    parts = load_freq_sidecar_basins(sidecar_file, basins, n_workers, yrly_freq)
+    return next(iter(parts.values())) if len(parts) == 1 else stack_basin_hazards(parts)
+
+
+def materialize_freq_sidecar(sidecar_file, out_dir=None, write_basins=True, n_workers=None, yrly_freq=None):
+    """
+    Write the frequency corrected global hazard of a sidecar file, and optionally the per-basin hazards, with
+    the names and event codes of the full output mode, so that the map scripts can read them unchanged.
+    The global file is the sidecar name without '_sidecar', the basin files replace 'TC_global_' with
+    'TC_{basin}_'. With yrly_freq, the correction is redone for new yearly observed frequencies (see
+    load_freq_sidecar_basins). Returns the paths of the written files.
+    """
+    sidecar_file = Path(sidecar_file)
+    out_dir = Path(out_dir) if out_dir else sidecar_file.parent
+    global_name = sidecar_file.name.replace('_sidecar', '')
+    with h5py.File(sidecar_file, 'r') as f:
+        model, cat = f.attrs['model'] or None, f.attrs['cat'] or None
+
+    basin_hazards = load_freq_sidecar_basins(sidecar_file, n_workers=n_workers, yrly_freq=yrly_freq)
+    out_files = {}
+    if write_basins:
+        for bsn, hazard in basin_hazards.items():
+            out_files[bsn] = out_dir / global_name.replace('TC_global_', f'TC_{bsn}_')
+            hazard.write_hdf5(out_files[bsn])
+
+    global_haz = stack_basin_hazards(basin_hazards)
+    out_files['global'] = out_dir / global_name
+    global_haz.write_hdf5(out_files['global'])
+    write_event_codes(out_files['global'], global_haz.event_id, model, cat)
+    print(f"Materialized {sidecar_file} to {out_files['global']}")
+    return out_files
+
+
+def update_sidecar_frequency(sidecar_file, yrly_freq, out_file):
+    """
+    Write a copy of a sidecar file to out_file with the frequency correction redone for new yearly
+    observed frequencies per basin (see rescale_sidecar_frequency). The original sidecar is left
+    unchanged, so that the resume manifest of freq_corr.py still recognizes it as complete.
+    """
+    if Path(out_file).resolve() == Path(sidecar_file).resolve():
+        raise ValueError(f"Refusing to update {sidecar_file} in place, give a different out_file.")
+    shutil.copyfile(sidecar_file, out_file)
+    with h5py.File(out_file, 'r+') as f:
+        basins = list(f.attrs['basins'])
+        f['frequency'][...] = rescale_sidecar_frequency(
+            f['frequency'][:], f['basin'][:], basins, json.loads(f.attrs['yrly_freq']), yrly_freq)
+        f.attrs['yrly_freq'] = json.dumps(yrly_freq)
+    print(f"Saved frequency sidecar of {sidecar_file} with updated frequencies to {out_file}")
+
+
+def encode_event_ids(hazards_dict):
+    """
+    Give the events of each basin hazard compact integer IDs, basin label * EVENT_ID_STRIDE + event
+    index within the basin, instead of per-event name strings. Names are left empty and can be
+    reconstructed on demand with event_names.
+    """
+    basins = list(BASIN_BOUNDARIES)
+    for bsn, hazard in hazards_dict.items():
+        hazard.event_id = basins.index(bsn) * EVENT_ID_STRIDE + np.arange(hazard.size, dtype=np.int64)
+        hazard.event_name = []
+
+
+def event_names(event_id, model=None, cat=None):
+    """
+    Reconstruct event names such as '{model}_{cat}_ev{i}_{basin}' from event IDs, or 'ev{i}_{basin}' if the
+    model or the TCGI is not given.
+    """
+    event_id = np.asarray(event_id, dtype=np.int64)
+    basins = np.array(list(BASIN_BOUNDARIES))[event_id // EVENT_ID_STRIDE]
+    prefix = f"{model}_{cat}_" if model and cat else ""
+    return [f"{prefix}ev{i}_{bsn}" for i, bsn in zip(event_id % EVENT_ID_STRIDE, basins)]
+
+
+def write_event_codes(hazard_file, event_id, model=None, cat=None):
+    """
+    Add the integer event codes of a saved hazard to its file: small integer columns for model,
+    TCGI, basin and event index in the group 'event_codes', with the lookup tables of models,
+    TCGIs and basins as attributes. Column value -1 means no model or TCGI (e.g. ERA5).
+    """
+    event_id = np.asarray(event_id, dtype=np.int64)
+    n_ev = event_id.size
+    with h5py.File(hazard_file, 'a') as f:
+        if 'event_codes' in f:
+            del f['event_codes']
+        grp = f.create_group('event_codes')
+        grp.create_dataset('model', data=np.full(n_ev, 0 if model else -1, dtype=np.int8), compression='gzip')
+        grp.create_dataset('cat', data=np.full(n_ev, 0 if cat else -1, dtype=np.int8), compression='gzip')
+        grp.create_dataset('basin', data=(event_id // EVENT_ID_STRIDE).astype(np.int8), compression='gzip')
+        grp.create_dataset('index', data=(event_id % EVENT_ID_STRIDE).astype(np.int32), compression='gzip')
+        grp.attrs['models'] = [model] if model else []
+        grp.attrs['cats'] = [cat] if cat else []
+        grp.attrs['basins'] = list(BASIN_BOUNDARIES)
+
+
+def read_event_names(hazard_file, idx=None):
+    """
+    Reconstruct the names of the events at positions idx (default: all) from the event codes of a hazard file,
+    as in event_names: without a model or TCGI code (-1), the names are 'ev{i}_{basin}'.
+    """
+    sel = slice(None) if idx is None else np.asarray(idx)
+    with h5py.File(hazard_file, 'r') as f:
+        grp = f['event_codes']
+        models, cats, basins = list(grp.attrs['models']), list(grp.attrs['cats']), list(grp.attrs['basins'])
+        model, cat, basin, index = (grp[col][sel] for col in ['model', 'cat', 'basin', 'index'])
+
+    return [
+        (f"{models[m]}_{cats[c]}_" if m >= 0 and c >= 0 else "") + f"ev{i}_{basins[b]}"
+        for m, c, b, i in zip(model, cat, basin, index)
+    ]
@@ -6,9 +6,9 @@ from shapely.geometry import Point
 from pathlib import Path
 
 sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
-from hazard_map_utils import gdf_to_raster
+from hazard_map_utils import gdf_to_raster, netcdf_encoding
 
-def gdf_to_clean_netcdf(gdf, path, description, units):
+def gdf_to_clean_netcdf(gdf, path, description, units, encoding="point"):
     """
     Save a GeoDataFrame to a NetCDF file with clean variable names: lat, lon, and data columns only.
     """
@@ -25,7 +25,7 @@ def gdf_to_clean_netcdf(gdf, path, description, units):
         ds[col].attrs['description'] = description.get(col, "")
         ds[col].attrs['units'] = units
 
-    ds.to_netcdf(path)
+    ds.to_netcdf(path, encoding=netcdf_encoding(ds, encoding))
     print(f"Saved clean NetCDF to {path}")
 
 
@@ -6,10 +6,10 @@ from shapely.geometry import Point
 from pathlib import Path
 
 sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
-from main.hazard_map_utils import gdf_to_raster
+from main.hazard_map_utils import gdf_to_raster, netcdf_encoding
 
 
-def gdf_to_clean_netcdf(gdf, path, description, units, also_csv=False):
+def gdf_to_clean_netcdf(gdf, path, description, units, also_csv=False, encoding="point"):
     """
     Save a GeoDataFrame to a NetCDF file with clean lat/lon and variable names.
     """
@@ -26,7 +26,7 @@ def gdf_to_clean_netcdf(gdf, path, description, units, also_csv=False):
         ds[col].attrs["description"] = description.get(col, "")
         ds[col].attrs["units"] = units
 
-    ds.to_netcdf(path)
+    ds.to_netcdf(path, encoding=netcdf_encoding(ds, encoding))
     print(f"Saved clean NetCDF to: {path}")
 
     if also_csv:
@@ -35,7 +35,7 @@ def gdf_to_clean_netcdf(gdf, path, description, units, also_csv=False):
         print(f"Also saved CSV to: {csv_path}")
 
 
-def combine_tiles(input_dir, output_dir, base_name, variable):
+def combine_tiles(input_dir, output_dir, base_name, variable, shapefile_path=None, buffer_dist=0.0):
     input_dir = Path(input_dir)
     output_dir = Path(output_dir)
     output_dir.mkdir(parents=True, exist_ok=True)
@@ -100,7 +100,9 @@ def combine_tiles(input_dir, output_dir, base_name, variable):
         grid_res=0.05,
         method="linear",
         description=description,
-        units=units
+        units=units,
+        shapefile_path=shapefile_path,
+        buffer_dist=buffer_dist
     )
 
     print(f"Finished combining tiles for: {base_out}")
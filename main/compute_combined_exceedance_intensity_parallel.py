@@ -3,45 +3,43 @@ import argparse
 import gc
 import rioxarray
 import numpy as np
-from pathlib import Path
 from climada.util.constants import SYSTEM_DIR
-from climada.hazard import TropCyclone, Hazard
+from climada.hazard import TropCyclone
 
 sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
-from main.hazard_map_utils import gdf_to_netcdf, gdf_to_raster
+from main.hazard_map_utils import array_to_gdf, gdf_to_netcdf, gdf_to_raster
+from main.hazard_stats_utils import RETURN_PERIODS, stream_curves, curves_exceedance_intensity
+from main.hazard_io_utils import read_frequency, read_centroids, iter_intensity_rows, centroids_key, check_centroids
 
-def main(lon_min, lon_max, lat_min, lat_max, scenario, cat, wind, period):
+def main(lon_min, lon_max, lat_min, lat_max, scenario, cat, wind, period, chunk_size=20000):
     assert lon_min < lon_max and lat_min < lat_max, "Invalid spatial extent: check min/max values."
 
     basin = "global"
     models = ["CESM2", "CNRM-CM6-1", "EC-Earth3", "IPSL-CM6A-LR", "MIROC6", "UKESM1-0-LL"]
     haz_dir = SYSTEM_DIR / "hazard" / "future" / "CHAZ"
 
-    all_events = []
+    # Merge the per-centroid curves of one model at a time, restricted to the tile, instead of concatenating
+    # all models; the curves are truncated to the points needed for the return periods. Columns are merged by
+    # position, so every file must have the centroids of the first
+    curves, centroids, sel_cen = None, None, None
     for model in models:
         file = haz_dir / f"TC_{basin}_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5"
-        print(f"Loading hazard from: {file}")
-        tc_hazard = TropCyclone.from_hdf5(file)
-        tc_hazard.event_id = np.arange(tc_hazard.intensity.shape[0])
-        print(f"Loaded {tc_hazard.size} events.")
-        all_events.append(tc_hazard)
-
-    print("Concatenating all hazard sets")
-    combined_hazard = Hazard.concat(all_events)
-    combined_hazard.event_id = np.arange(combined_hazard.intensity.shape[0])
-
-    print("Selecting regional subset")
-    comb_haz_split = combined_hazard.select(extent=(lon_min, lon_max, lat_min, lat_max))
-
-    # Free memory
-    del combined_hazard
-    gc.collect()
+        print(f"Merging hazard from: {file}")
+        if centroids is None:
+            centroids = read_centroids(file)
+            cen_key = centroids_key(file)
+            sel_cen = np.flatnonzero(centroids.select_mask(extent=(lon_min, lon_max, lat_min, lat_max)))
+        else:
+            check_centroids(file, cen_key)
+        curves = stream_curves(
+            iter_intensity_rows(file, chunk_size, columns=sel_cen), read_frequency(file),
+            min_intensity=TropCyclone.intensity_thres, curves=curves, return_periods=RETURN_PERIODS
+        )
+        gc.collect()
 
     print("Computing local exceedance intensity...")
-    gdf_exceed, _, _ = comb_haz_split.local_exceedance_intensity(
-        return_periods=[10, 25, 50, 100, 250, 1000],
-        method="extrapolate_constant"
-    )
+    exceed = curves_exceedance_intensity(curves, RETURN_PERIODS, method="extrapolate_constant")
+    gdf_exceed = array_to_gdf(exceed, centroids.lat[sel_cen], centroids.lon[sel_cen], RETURN_PERIODS)
 
     out_dir = haz_dir / "maps"
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -85,5 +83,6 @@ if __name__ == "__main__":
     parser.add_argument("--cat", type=str, required=True, help="Category threshold (e.g., cat1)")
     parser.add_argument("--wind", type=str, required=True, help="Wind field (e.g., vmax)")
     parser.add_argument("--period", type=str, required=True, help="Time period (e.g., 2050)")
+    parser.add_argument("--chunk_size", type=int, default=20000, help="Number of events per streamed chunk")
     args = parser.parse_args()
     main(**vars(args))
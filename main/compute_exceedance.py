@@ -2,26 +2,83 @@ import sys
 import argparse
 import rioxarray
 import numpy as np
-from pathlib import Path
 from climada.util.constants import SYSTEM_DIR
 from climada.hazard import TropCyclone
 
 sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
-from main.hazard_map_utils import gdf_to_netcdf, gdf_to_raster
+from main.hazard_map_utils import array_to_gdf, gdf_to_netcdf, gdf_to_raster
+from main.hazard_stats_utils import (
+    RETURN_PERIODS, exceedance_intensity, top_k_size, stream_top_k, curves_exceedance_intensity,
+    bootstrap_exceedance_intensity
+)
+from main.hazard_io_utils import read_frequency, read_centroids, iter_intensity_rows, read_event_years
 
-def main(model, scenario, cat, wind, period):
+def save_bootstrap(tc_hazard, file, out_dir, fname_base, n_boot, percentiles, shapefile_path=None, buffer_dist=0.0):
+    """Save bootstrap percentiles of the exceedance intensity, resampling years."""
+    groups = read_event_years(file)
+    print(f"Bootstrapping {n_boot} resamples of {len(set(groups))} years...")
+    boot = bootstrap_exceedance_intensity(
+        tc_hazard.intensity, tc_hazard.frequency, groups, return_periods=RETURN_PERIODS, n_boot=n_boot,
+        percentiles=percentiles, min_intensity=tc_hazard.intensity_thres, method="extrapolate_constant"
+    )
+    values = np.hstack(list(boot))
+    columns = [f"{rp}_p{pct:g}" for pct in percentiles for rp in RETURN_PERIODS]
+    gdf_boot = array_to_gdf(values, tc_hazard.centroids.lat, tc_hazard.centroids.lon, columns)
+    description = {
+        col: f"Exceedance intensity for RP={col.split('_p')[0]} years, bootstrap percentile {col.split('_p')[1]} "
+             f"({n_boot} resamples of years)"
+        for col in columns
+    }
+
+    gdf_to_netcdf(
+        gdf_boot,
+        out_dir / f"{fname_base}_exceedance_intensity_bootstrap.nc",
+        variable_prefix="rp",
+        description=description,
+        units="m/s"
+    )
+
+    gdf_to_raster(
+        gdf_boot,
+        out_dir / f"{fname_base}_exceedance_intensity_bootstrap_raster.nc",
+        variable_prefix="rp",
+        grid_res=0.05,
+        method="linear",
+        description=description,
+        units="m/s",
+        shapefile_path=shapefile_path,
+        buffer_dist=buffer_dist
+    )
+
+def main(model, scenario, cat, wind, period, stream=False, chunk_size=20000, bootstrap=0,
+         percentiles=(5, 50, 95), shapefile_path=None, buffer_dist=0.0):
+    if bootstrap and stream:
+        raise ValueError("Bootstrap needs the full hazard and cannot be combined with --stream")
     basin = "global"
     #haz_dir = Path("/nfs/n2o/wcr/meilers/data/hazard/future/CHAZ-update")
     haz_dir = SYSTEM_DIR/"hazard"/"future"/"CHAZ"
     file = haz_dir / f"TC_{basin}_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5"
 
-    print(f"Loading hazard from: {file}")
-    tc_hazard = TropCyclone.from_hdf5(file)
-    tc_hazard.event_id = np.arange(tc_hazard.intensity.shape[0])
-
-    gdf_exceed, _, _ = tc_hazard.local_exceedance_intensity(
-        return_periods=[10, 25, 50, 100, 250, 1000], method="extrapolate_constant"
-    )
+    if stream:
+        # Only the k most intense events per centroid determine the exceedance intensities
+        frequency = read_frequency(file)
+        centroids = read_centroids(file)
+        k = top_k_size(frequency, RETURN_PERIODS)
+        print(f"Streaming events from: {file} (keeping top {k} events per centroid)")
+        curves = stream_top_k(
+            iter_intensity_rows(file, chunk_size), frequency, centroids.size, k,
+            min_intensity=TropCyclone.intensity_thres
+        )
+        exceed = curves_exceedance_intensity(curves, RETURN_PERIODS, method="extrapolate_constant")
+    else:
+        print(f"Loading hazard from: {file}")
+        tc_hazard = TropCyclone.from_hdf5(file)
+        centroids = tc_hazard.centroids
+        exceed = exceedance_intensity(
+            tc_hazard.intensity, tc_hazard.frequency, return_periods=RETURN_PERIODS,
+            min_intensity=tc_hazard.intensity_thres, method="extrapolate_constant"
+        )
+    gdf_exceed = array_to_gdf(exceed, centroids.lat, centroids.lon, RETURN_PERIODS)
 
     out_dir = haz_dir / "maps"
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -49,9 +106,14 @@ def main(model, scenario, cat, wind, period):
             col: f"Exceedance intensity for RP={col} years"
             for col in gdf_exceed.columns if col != "geometry"
         },
-        units="m/s"
+        units="m/s",
+        shapefile_path=shapefile_path,
+        buffer_dist=buffer_dist
     )
 
+    if bootstrap:
+        save_bootstrap(tc_hazard, file, out_dir, fname_base, bootstrap, percentiles, shapefile_path, buffer_dist)
+
     print(f"Finished exceedance intensity processing for {file}")
 
 if __name__ == "__main__":
@@ -61,6 +123,16 @@ if __name__ == "__main__":
     parser.add_argument("--cat", type=str, required=True)
     parser.add_argument("--wind", type=str, required=True)
     parser.add_argument("--period", type=str, required=True)
+    parser.add_argument("--stream", action="store_true",
+                        help="Stream event chunks from the file and keep only the top-K events per centroid")
+    parser.add_argument("--chunk_size", type=int, default=20000, help="Number of events per streamed chunk")
+    parser.add_argument("--bootstrap", type=int, default=0,
+                        help="Number of bootstrap resamples of years for confidence intervals (default: none)")
+    parser.add_argument("--percentiles", type=float, nargs="+", default=[5, 50, 95],
+                        help="Bootstrap percentiles to save")
+    parser.add_argument("--shapefile_path", type=str, default=None,
+                        help="Land shapefile (e.g. ne_10m_land.shp); if given, rasters only cover land cells")
+    parser.add_argument("--buffer_dist", type=float, default=0.0, help="Buffer of the land polygons in degrees")
 
     args = parser.parse_args()
     main(**vars(args))
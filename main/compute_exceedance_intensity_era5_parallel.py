@@ -1,33 +1,29 @@
 import sys
-import gc
 import rioxarray
 import argparse
-import numpy as np
 from pathlib import Path
 from climada.hazard import TropCyclone
 
 sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
-from main.hazard_map_utils import gdf_to_netcdf, gdf_to_raster
+from main.hazard_map_utils import array_to_gdf, gdf_to_netcdf, gdf_to_raster
+from main.hazard_io_utils import load_hazard_tile
+from main.hazard_stats_utils import RETURN_PERIODS, exceedance_intensity
 
 def main(lon_min, lon_max, lat_min, lat_max):
     basin = "global"
     haz_dir = Path("/cluster/work/climate/meilers/climada/data/hazard/")
     file = haz_dir / f"TC_{basin}_0300as_CHAZ_ERA5_freq-corr.hdf5"
 
-    print(f"Loading hazard from: {file}")
-    tc_hazard = TropCyclone.from_hdf5(file)
-    tc_hazard.event_id = np.arange(tc_hazard.intensity.shape[0])
+    # Keep the centroids within the input bounds and the events with nonzero intensity there. The file is
+    # scanned chunk by chunk, so memory stays bounded, but only intensity values near the tile are read
+    print(f"Loading hazard tile from: {file}")
+    hazard_split = load_hazard_tile(file, extent=(lon_min, lon_max, lat_min, lat_max))
 
-    # Select the region based on input bounds
-    hazard_split = tc_hazard.select(extent=(lon_min, lon_max, lat_min, lat_max))
-
-    # delete the original hazard object to free up memory
-    del tc_hazard
-    gc.collect()
-
-    gdf_exceed, _, _ = hazard_split.local_exceedance_intensity(
-        return_periods=[10, 25, 50, 100, 250, 1000], method="extrapolate_constant"
+    exceed = exceedance_intensity(
+        hazard_split.intensity, hazard_split.frequency, return_periods=RETURN_PERIODS,
+        min_intensity=TropCyclone.intensity_thres, method="extrapolate_constant"
     )
+    gdf_exceed = array_to_gdf(exceed, hazard_split.centroids.lat, hazard_split.centroids.lon, RETURN_PERIODS)
 
     out_dir = Path("/cluster/work/climate/meilers/climada/data/hazard/future/CHAZ/maps")
     out_dir.mkdir(parents=True, exist_ok=True)
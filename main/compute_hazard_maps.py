@@ -0,0 +1,115 @@
+import sys
+import gc
+import argparse
+import rioxarray
+import numpy as np
+from pathlib import Path
+from climada.util.constants import SYSTEM_DIR
+from climada.hazard import TropCyclone
+
+sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
+from main.hazard_map_utils import array_to_gdf, write_metric_maps
+from main.hazard_io_utils import (
+    read_frequency, read_centroids, iter_intensity_rows, load_hazard_tile,
+    centroids_key, check_centroids
+)
+from main.hazard_stats_utils import (
+    RETURN_PERIODS, THRESHOLDS, hazard_statistics, stream_curves, curves_statistics, threshold_sweep
+)
+
+MODELS = ["CESM2", "CNRM-CM6-1", "EC-Earth3", "IPSL-CM6A-LR", "MIROC6", "UKESM1-0-LL"]
+
+def combined_statistics(files, extent, return_periods, thresholds, chunk_size=20000):
+    """
+    Merge the per-centroid curves of several hazard files one file at a time and compute both metrics.
+    Columns are merged by position, so all files must have the centroids of the first.
+    """
+    curves, centroids, sel_cen = None, None, None
+    for file in files:
+        print(f"Merging hazard from: {file}")
+        if centroids is None:
+            centroids = read_centroids(file)
+            cen_key = centroids_key(file)
+            mask = centroids.select_mask(extent=extent) if extent else np.ones(centroids.size, dtype=bool)
+            sel_cen = np.flatnonzero(mask)
+        else:
+            check_centroids(file, cen_key)
+        curves = stream_curves(
+            iter_intensity_rows(file, chunk_size, columns=sel_cen), read_frequency(file),
+            min_intensity=TropCyclone.intensity_thres, curves=curves,
+            return_periods=return_periods, thresholds=thresholds
+        )
+        gc.collect()
+
+    stats = curves_statistics(curves, return_periods, thresholds, method="extrapolate_constant")
+    return (stats[:, :len(return_periods)], stats[:, len(return_periods):],
+            centroids.lat[sel_cen], centroids.lon[sel_cen])
+
+def main(source, lon_min=None, lon_max=None, lat_min=None, lat_max=None, model=None, scenario=None, cat=None,
+         wind=None, period=None, return_periods=RETURN_PERIODS, thresholds=THRESHOLDS, sweep=None, chunk_size=20000,
+         shapefile_path=None, buffer_dist=0.0):
+    extent = (lon_min, lon_max, lat_min, lat_max) if lon_min is not None else None
+    tile = f"{lon_min}_{lon_max}_{lat_min}_{lat_max}" if extent else "global"
+    thresholds = threshold_sweep(*sweep) if sweep else thresholds
+
+    if source == "combined":
+        haz_dir = SYSTEM_DIR / "hazard" / "future" / "CHAZ"
+        files = [haz_dir / f"TC_global_0300as_CHAZ_{gcm}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5" for gcm in MODELS]
+        exceed, rp, lat, lon = combined_statistics(files, extent, return_periods, thresholds, chunk_size)
+        out_dir = haz_dir / "maps"
+        fname_base = f"TC_{tile}_0300as_CHAZ_ALL-MODELS_{period}_{scenario}_480ens_{cat}_{wind}"
+    else:
+        if source == "era5":
+            file = Path("/cluster/work/climate/meilers/climada/data/hazard/TC_global_0300as_CHAZ_ERA5_freq-corr.hdf5")
+            out_dir = Path("/cluster/work/climate/meilers/climada/data/hazard/future/CHAZ/maps")
+            fname_base = f"TC_{tile}_0300as_CHAZ_ERA5"
+        else:
+            haz_dir = SYSTEM_DIR / "hazard" / "future" / "CHAZ"
+            file = haz_dir / f"TC_global_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5"
+            out_dir = haz_dir / "maps"
+            fname_base = f"TC_{tile}_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}"
+
+        print(f"Loading hazard from: {file}")
+        hazard = load_hazard_tile(file, extent=extent, chunk_size=chunk_size)
+        print("Computing exceedance intensity and return periods...")
+        exceed, rp = hazard_statistics(
+            hazard.intensity, hazard.frequency, return_periods=return_periods, thresholds=thresholds,
+            min_intensity=TropCyclone.intensity_thres, method="extrapolate_constant"
+        )
+        lat, lon = hazard.centroids.lat, hazard.centroids.lon
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    write_metric_maps(array_to_gdf(exceed, lat, lon, [f"{val:g}" for val in return_periods]),
+                      out_dir, fname_base, "exceedance_intensity", shapefile_path=shapefile_path,
+                      buffer_dist=buffer_dist)
+    write_metric_maps(array_to_gdf(rp, lat, lon, [f"{thr:g}" for thr in thresholds]),
+                      out_dir, fname_base, "return_periods", shapefile_path=shapefile_path,
+                      buffer_dist=buffer_dist)
+
+    print(f"Finished exceedance intensity and return period maps for {fname_base}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute exceedance intensity and return period maps in one pass.")
+    parser.add_argument("--source", type=str, required=True, choices=["gcm", "era5", "combined"],
+                        help="Single GCM, historical (ERA5) or multi-model hazard")
+    parser.add_argument("--lon_min", type=float, default=None, help="Minimum longitude (default: global)")
+    parser.add_argument("--lon_max", type=float, default=None, help="Maximum longitude")
+    parser.add_argument("--lat_min", type=float, default=None, help="Minimum latitude")
+    parser.add_argument("--lat_max", type=float, default=None, help="Maximum latitude")
+    parser.add_argument("--model", type=str, default=None, help="GCM, for source gcm")
+    parser.add_argument("--scenario", type=str, default=None, help="Climate scenario (e.g., ssp370)")
+    parser.add_argument("--cat", type=str, default=None, help="Category threshold (e.g., cat1)")
+    parser.add_argument("--wind", type=str, default=None, help="Wind field (e.g., vmax)")
+    parser.add_argument("--period", type=str, default=None, help="Time period (e.g., 2050)")
+    parser.add_argument("--return_periods", type=float, nargs="+", default=RETURN_PERIODS,
+                        help="Return periods in years (default: 10 25 50 100 250 1000)")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS,
+                        help="Threshold intensities in m/s (default: 33 50)")
+    parser.add_argument("--sweep", type=float, nargs=3, metavar=("MIN", "MAX", "STEP"), default=None,
+                        help="Dense threshold sweep, e.g. 18 80 1; overrides --thresholds")
+    parser.add_argument("--chunk_size", type=int, default=20000, help="Number of events per read chunk")
+    parser.add_argument("--shapefile_path", type=str, default=None,
+                        help="Land shapefile (e.g. ne_10m_land.shp); if given, rasters only cover land cells")
+    parser.add_argument("--buffer_dist", type=float, default=0.0, help="Buffer of the land polygons in degrees")
+    args = parser.parse_args()
+    main(**vars(args))
@@ -1,15 +1,14 @@
 import sys
 import argparse
 import rioxarray
-import numpy as np
-from pathlib import Path
 from climada.util.constants import SYSTEM_DIR
 from climada.hazard import TropCyclone
 
 sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
-from main.hazard_map_utils import gdf_to_netcdf, gdf_to_raster
+from main.hazard_map_utils import array_to_gdf, gdf_to_netcdf, gdf_to_raster
+from main.hazard_stats_utils import THRESHOLDS, return_period, threshold_sweep
 
-def main(model, scenario, cat, wind, period):
+def main(model, scenario, cat, wind, period, thresholds=THRESHOLDS, sweep=None, shapefile_path=None, buffer_dist=0.0):
     basin = "global"
     #haz_dir = Path("/nfs/n2o/wcr/meilers/data/hazard/future/CHAZ-update")
     haz_dir = SYSTEM_DIR/"hazard"/"future"/"CHAZ"
@@ -17,11 +16,13 @@ def main(model, scenario, cat, wind, period):
 
     print(f"Loading hazard from: {file}")
     tc_hazard = TropCyclone.from_hdf5(file)
-    tc_hazard.event_id = list(range(tc_hazard.intensity.shape[0]))
 
-    gdf_return, _, _ = tc_hazard.local_return_period(
-        threshold_intensities=[33, 50], method="extrapolate_constant"
+    thresholds = threshold_sweep(*sweep) if sweep else thresholds
+    rp = return_period(
+        tc_hazard.intensity, tc_hazard.frequency, thresholds=thresholds,
+        min_intensity=tc_hazard.intensity_thres, method="extrapolate_constant"
     )
+    gdf_return = array_to_gdf(rp, tc_hazard.centroids.lat, tc_hazard.centroids.lon, [f"{thr:g}" for thr in thresholds])
 
     out_dir = haz_dir / "maps"
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -49,7 +50,9 @@ def main(model, scenario, cat, wind, period):
             col: f"Return period for intensity \u2265 {col} m/s"
             for col in gdf_return.columns if col != "geometry"
         },
-        units="years"
+        units="years",
+        shapefile_path=shapefile_path,
+        buffer_dist=buffer_dist
     )
 
     print(f"Finished return period processing for {file}")
@@ -61,6 +64,13 @@ if __name__ == "__main__":
     parser.add_argument("--cat", type=str, required=True)
     parser.add_argument("--wind", type=str, required=True)
     parser.add_argument("--period", type=str, required=True)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS,
+                        help="Threshold intensities in m/s (default: 33 50)")
+    parser.add_argument("--sweep", type=float, nargs=3, metavar=("MIN", "MAX", "STEP"), default=None,
+                        help="Dense threshold sweep, e.g. 18 80 1; overrides --thresholds")
+    parser.add_argument("--shapefile_path", type=str, default=None,
+                        help="Land shapefile (e.g. ne_10m_land.shp); if given, rasters only cover land cells")
+    parser.add_argument("--buffer_dist", type=float, default=0.0, help="Buffer of the land polygons in degrees")
 
     args = parser.parse_args()
     main(**vars(args))
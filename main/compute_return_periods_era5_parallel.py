@@ -1,33 +1,30 @@
 import sys
-import gc
 import rioxarray
 import argparse
-import numpy as np
 from pathlib import Path
 from climada.hazard import TropCyclone
 
 sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
-from main.hazard_map_utils import gdf_to_netcdf, gdf_to_raster
+from main.hazard_map_utils import array_to_gdf, gdf_to_netcdf, gdf_to_raster
+from main.hazard_io_utils import load_hazard_tile
+from main.hazard_stats_utils import THRESHOLDS, return_period, threshold_sweep
 
-def main(lon_min, lon_max, lat_min, lat_max):
+def main(lon_min, lon_max, lat_min, lat_max, thresholds=THRESHOLDS, sweep=None):
     basin = "global"
     haz_dir = Path("/cluster/work/climate/meilers/climada/data/hazard/")
     file = haz_dir / f"TC_{basin}_0300as_CHAZ_ERA5_freq-corr.hdf5"
 
-    print(f"Loading hazard from: {file}")
-    tc_hazard = TropCyclone.from_hdf5(file)
-    tc_hazard.event_id = np.arange(tc_hazard.intensity.shape[0])
+    # Keep the centroids within the input bounds and the events with nonzero intensity there. The file is
+    # scanned chunk by chunk, so memory stays bounded, but only intensity values near the tile are read
+    print(f"Loading hazard tile from: {file}")
+    hazard_split = load_hazard_tile(file, extent=(lon_min, lon_max, lat_min, lat_max))
 
-    # Select the region based on input bounds
-    hazard_split = tc_hazard.select(extent=(lon_min, lon_max, lat_min, lat_max))
-    
-    # delete the original hazard object to free up memory
-    del tc_hazard
-    gc.collect()
-
-    gdf_return, _, _ = hazard_split.local_return_period(
-        threshold_intensities=[33, 50], method="extrapolate_constant"
+    thresholds = threshold_sweep(*sweep) if sweep else thresholds
+    rp = return_period(
+        hazard_split.intensity, hazard_split.frequency, thresholds=thresholds,
+        min_intensity=TropCyclone.intensity_thres, method="extrapolate_constant"
     )
+    gdf_return = array_to_gdf(rp, hazard_split.centroids.lat, hazard_split.centroids.lon, [f"{thr:g}" for thr in thresholds])
 
     out_dir = Path("/cluster/work/climate/meilers/climada/data/hazard/future/CHAZ/maps")
     out_dir.mkdir(parents=True, exist_ok=True)
@@ -66,6 +63,10 @@ if __name__ == "__main__":
     parser.add_argument("--lon_max", type=float, required=True, help="Maximum longitude")
     parser.add_argument("--lat_min", type=float, required=True, help="Minimum latitude")
     parser.add_argument("--lat_max", type=float, required=True, help="Maximum latitude")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS,
+                        help="Threshold intensities in m/s (default: 33 50)")
+    parser.add_argument("--sweep", type=float, nargs=3, metavar=("MIN", "MAX", "STEP"), default=None,
+                        help="Dense threshold sweep, e.g. 18 80 1; overrides --thresholds")
     args = parser.parse_args()
 
-    main(args.lon_min, args.lon_max, args.lat_min, args.lat_max)
+    main(args.lon_min, args.lon_max, args.lat_min, args.lat_max, args.thresholds, args.sweep)
@@ -0,0 +1,71 @@
+import sys
+import argparse
+import numpy as np
+from pathlib import Path
+from climada.hazard import TropCyclone
+
+sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
+from main.hazard_map_utils import array_to_gdf, gdf_to_netcdf
+from main.hazard_stats_utils import (
+    build_exceedance_index, write_exceedance_index, open_exceedance_index, index_dir_for,
+    index_extent_mask, index_exceedance_intensity, index_return_period
+)
+
+def build(file, index_dir=None):
+    """Precompute the per-centroid exceedance index of a hazard file."""
+    file = Path(file)
+    index_dir = index_dir or index_dir_for(file)
+
+    print(f"Loading hazard from: {file}")
+    tc_hazard = TropCyclone.from_hdf5(file)
+
+    print("Building exceedance index...")
+    index = build_exceedance_index(
+        tc_hazard.intensity, tc_hazard.frequency, tc_hazard.centroids.lat, tc_hazard.centroids.lon,
+        min_intensity=tc_hazard.intensity_thres
+    )
+    stat = file.stat()
+    write_exceedance_index(index_dir, index, source_file=str(file), source_size=stat.st_size,
+                           source_mtime_ns=stat.st_mtime_ns)
+
+def query(index_dir, out_file, return_periods=None, thresholds=None, extent=None):
+    """Compute exceedance intensities or return periods for any centroid set from an exceedance index."""
+    index = open_exceedance_index(index_dir)
+    centroids = np.flatnonzero(index_extent_mask(index, extent)) if extent else np.arange(index.lat.size)
+    print(f"Querying {centroids.size} centroids from {index_dir}")
+
+    if return_periods:
+        values = index_exceedance_intensity(index, return_periods, centroids)
+        columns, prefix, units = [f"{rp:g}" for rp in return_periods], "rp", "m/s"
+        description = {col: f"Exceedance intensity for RP={col} years" for col in columns}
+    else:
+        values = index_return_period(index, thresholds, centroids)
+        columns, prefix, units = [f"{thr:g}" for thr in thresholds], "thr", "years"
+        description = {col: f"Return period for intensity ≥ {col} m/s" for col in columns}
+
+    gdf = array_to_gdf(values, index.lat[centroids], index.lon[centroids], columns)
+    gdf_to_netcdf(gdf, out_file, variable_prefix=prefix, description=description, units=units)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build or query per-centroid exceedance indexes of hazard files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    parser_build = subparsers.add_parser("build", help="Precompute the exceedance index of a hazard file")
+    parser_build.add_argument("file", type=str, help="Hazard HDF5 file")
+    parser_build.add_argument("--index_dir", type=str, default=None,
+                              help="Index directory (default: <file>.exceedance_index next to the file)")
+
+    parser_query = subparsers.add_parser("query", help="Compute maps for any return periods or thresholds")
+    parser_query.add_argument("index_dir", type=str, help="Index directory")
+    parser_query.add_argument("out_file", type=str, help="Output NetCDF file (a CSV is written alongside)")
+    group = parser_query.add_mutually_exclusive_group(required=True)
+    group.add_argument("--return_periods", type=float, nargs="+", help="Return periods in years, e.g. 75 500")
+    group.add_argument("--thresholds", type=float, nargs="+", help="Threshold intensities in m/s")
+    parser_query.add_argument("--extent", type=float, nargs=4, default=None,
+                              metavar=("LON_MIN", "LON_MAX", "LAT_MIN", "LAT_MAX"), help="Restrict to an extent")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        build(args.file, args.index_dir)
+    else:
+        query(args.index_dir, args.out_file, args.return_periods, args.thresholds, args.extent)
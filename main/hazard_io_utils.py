@@ -0,0 +1,207 @@
+# hazard_io_utils.py
+"""
+Direct HDF5 access to climada hazard files, so that the intensity matrix can be read in pieces
+instead of loading the full TropCyclone.
+
+Hazards written by climada store the CSR intensity matrix (events x centroids) as the group
+'intensity' with datasets 'data', 'indices' and 'indptr' and the matrix shape as attribute.
+"""
+
+import h5py
+import hashlib
+import numpy as np
+from collections import namedtuple, OrderedDict
+from scipy import sparse
+
+from climada.hazard import Centroids
+
+# Part of a hazard within a tile: the selected centroids, the intensity (events x selected centroids)
+# and frequency of the events with nonzero intensity in the tile, and their indices in the hazard file
+HazardTile = namedtuple("HazardTile", ["centroids", "intensity", "frequency", "event_index"])
+
+# Names of the latitude and longitude datasets in the 'centroids' group of hazard files
+CENTROID_COORDS = [("lat", "lon"), ("latitude", "longitude")]
+
+
+def read_frequency(file):
+    """Read the event frequencies of a hazard file."""
+    with h5py.File(file, "r") as hf:
+        return hf["frequency"][:]
+
+
+def read_centroids(file):
+    """Read the centroids of a hazard file."""
+    return Centroids.from_hdf5(file)
+
+
+def coordinates_key(lat, lon):
+    """Hash of centroid coordinates."""
+    sha = hashlib.sha1()
+    sha.update(np.ascontiguousarray(lat, dtype=np.float64).tobytes())
+    sha.update(np.ascontiguousarray(lon, dtype=np.float64).tobytes())
+    return sha.hexdigest()
+
+
+def centroids_key(file):
+    """
+    Hash of the centroid coordinates of a hazard file, to check that hazard files share the same centroids.
+    Coordinates stored as datasets of the 'centroids' group (see CENTROID_COORDS) are hashed directly, without
+    building the Centroids; for other layouts the centroids are read with climada.
+    """
+    with h5py.File(file, "r") as hf:
+        grp = hf.get("centroids")
+        for lat_name, lon_name in CENTROID_COORDS if isinstance(grp, h5py.Group) else []:
+            lat, lon = grp.get(lat_name), grp.get(lon_name)
+            if isinstance(lat, h5py.Dataset) and isinstance(lon, h5py.Dataset):
+                return coordinates_key(lat[:], lon[:])
+    centroids = read_centroids(file)
+    return coordinates_key(centroids.lat, centroids.lon)
+
+
+def check_centroids(file, key):
+    """Raise a ValueError unless the centroids of file have the coordinates hashed in key (see centroids_key)."""
+    if centroids_key(file) != key:
+        raise ValueError(f"Centroids of {file} differ from those of the other hazard files")
+
+
+def intensity_shape(file):
+    """Shape (events, centroids) of the intensity matrix of a hazard file."""
+    with h5py.File(file, "r") as hf:
+        return tuple(int(n) for n in hf["intensity"].attrs["shape"])
+
+
+def read_positions(dset, pos, max_gap=4096):
+    """
+    Read the entries at the sorted positions pos of an HDF5 dataset. Positions at most max_gap (or one storage
+    chunk of the dataset, if larger) apart are coalesced into runs, and only these runs are read, one slice each.
+    """
+    if pos.size == 0:
+        return np.empty(0, dtype=dset.dtype)
+    max_gap = max(max_gap, dset.chunks[0] if dset.chunks else 0)
+    runs = np.split(pos, np.flatnonzero(np.diff(pos) > max_gap) + 1)
+    return np.concatenate([dset[run[0]:run[-1] + 1][run - run[0]] for run in runs])
+
+
+def iter_intensity_rows(file, chunk_size=10000, columns=None):
+    """
+    Yield (first event index, CSR chunk) of the intensity matrix in chunks of chunk_size events. With columns
+    (centroid indices), the chunks only hold these columns: the centroid indices of each chunk are read in
+    full, but intensity values only for the runs of entries in these columns (see read_positions).
+    """
+    with h5py.File(file, "r") as hf:
+        grp = hf["intensity"]
+        n_events, n_cen = grp.attrs["shape"]
+        indptr = grp["indptr"][:]
+        if columns is not None:
+            col_map = np.full(n_cen, -1, dtype=np.int64)
+            col_map[columns] = np.arange(len(columns))
+        for row_0 in range(0, n_events, chunk_size):
+            row_1 = min(row_0 + chunk_size, n_events)
+            start, end = indptr[row_0], indptr[row_1]
+            chunk_indptr = indptr[row_0:row_1 + 1] - start
+            if columns is None:
+                chunk = sparse.csr_matrix(
+                    (grp["data"][start:end], grp["indices"][start:end], chunk_indptr), shape=(row_1 - row_0, n_cen)
+                )
+                yield row_0, chunk
+                continue
+
+            new_col = col_map[grp["indices"][start:end]]
+            pos = np.flatnonzero(new_col >= 0)
+            data = read_positions(grp["data"], start + pos)
+            rows = np.repeat(np.arange(row_1 - row_0), np.diff(chunk_indptr))[pos]
+            chunk = sparse.csr_matrix((data, (rows, new_col[pos])), shape=(row_1 - row_0, len(columns)))
+            yield row_0, chunk
+
+
+def load_hazard_tile(file, extent=None, sel_cen=None, chunk_size=20000, centroids=None):
+    """
+    Load the part of a hazard file within extent (lon_min, lon_max, lat_min, lat_max) or the centroid mask
+    sel_cen, reading only the intensity of these centroids and keeping only events with nonzero intensity in them.
+    Without extent and sel_cen, all centroids are loaded. Centroids already read from another file with the
+    same centroids can be passed to skip parsing them again.
+    """
+    if centroids is None:
+        centroids = read_centroids(file)
+    if sel_cen is None:
+        sel_cen = centroids.select_mask(extent=extent) if extent else np.ones(centroids.size, dtype=bool)
+    columns = np.flatnonzero(sel_cen)
+
+    chunks, event_index = [], []
+    for row_0, chunk in iter_intensity_rows(file, chunk_size, columns):
+        rows = np.flatnonzero(np.diff(chunk.indptr))
+        chunks.append(chunk[rows])
+        event_index.append(row_0 + rows)
+    event_index = np.concatenate(event_index) if event_index else np.empty(0, dtype=np.int64)
+    if chunks:
+        intensity = sparse.vstack(chunks, format="csr")
+    else:
+        intensity = sparse.csr_matrix((0, columns.size))
+    frequency = read_frequency(file)[event_index]
+    print(f"Loaded {event_index.size} events with nonzero intensity at {columns.size} centroids from {file}")
+    return HazardTile(centroids.select(sel_cen=sel_cen), intensity, frequency, event_index)
+
+
+def column_nnz(file, chunk_size=1000000):
+    """Number of events with nonzero intensity at each centroid, counted from the stored CSR indices only."""
+    with h5py.File(file, "r") as hf:
+        grp = hf["intensity"]
+        n_cen = grp.attrs["shape"][1]
+        indices = grp["indices"]
+        nnz = np.zeros(n_cen, dtype=np.int64)
+        for start in range(0, indices.shape[0], chunk_size):
+            nnz += np.bincount(indices[start:start + chunk_size], minlength=n_cen)
+    return nnz
+
+
+def object_nbytes(obj):
+    """Approximate memory of arrays, sparse matrices and tuples or lists of them."""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if sparse.issparse(obj):
+        return sum(getattr(obj, attr).nbytes for attr in ("data", "indices", "indptr") if hasattr(obj, attr))
+    if isinstance(obj, (tuple, list)):
+        return sum(object_nbytes(item) for item in obj)
+    return 0
+
+
+class LRUCache:
+    """
+    Memory-bounded cache of loaded hazards and derived arrays: items are loaded on first access and the least
+    recently used ones are evicted once their total size exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._items = OrderedDict()
+        self._sizes = {}
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, loader):
+        """Return the cached item of key, calling loader() to load it if missing."""
+        if key in self._items:
+            self._items.move_to_end(key)
+            return self._items[key]
+        value = loader()
+        self._items[key] = value
+        self._sizes[key] = object_nbytes(value)
+        self.nbytes += self._sizes[key]
+        while self.nbytes > self.max_bytes and len(self._items) > 1:
+            old_key, _ = self._items.popitem(last=False)
+            self.nbytes -= self._sizes.pop(old_key)
+        return value
+
+
+def read_event_years(file):
+    """
+    Year of every event of a hazard file, from the event dates (proleptic Gregorian ordinals) that climada
+    stores in the 'date' dataset. Used as resampling groups for bootstrapping.
+    """
+    with h5py.File(file, "r") as hf:
+        if "date" not in hf:
+            raise ValueError(f"Hazard file {file} has no 'date' dataset, cannot group its events by year")
+        ordinal = hf["date"][:].astype(np.int64)
+    return (ordinal - 719163).astype("datetime64[D]").astype("datetime64[Y]").astype(int) + 1970
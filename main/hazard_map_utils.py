@@ -1,15 +1,227 @@
 # hazard_map_utils.py
 import os
+import hashlib
 import xarray as xr
 import rioxarray
 import numpy as np
-import pandas as pd
 import geopandas as gpd
 from pathlib import Path
+from scipy import sparse
+from scipy.spatial import Delaunay, cKDTree
 from scipy.interpolate import griddata
+from rasterio.features import geometry_mask
+from rasterio.transform import from_origin
 
 from climada.util.constants import SYSTEM_DIR
 
+# Interpolation weights are shared by all map products on the same centroids and grid
+WEIGHTS_DIR = SYSTEM_DIR / "interpolation_weights"
+_weights_memo = {}
+
+# Rasterized land masks, shared by all map products on the same grid
+LAND_MASK_DIR = SYSTEM_DIR / "land_masks"
+_land_mask_memo = {}
+
+# NetCDF encodings of the map products: float32 data with compression, chunked along the point index or in
+# spatial blocks sized for reading regional tiles. Use compression="zstd" instead of zlib with netCDF4 >= 1.6.
+ENCODING_PROFILES = {
+    "point": {"dtype": "float32", "zlib": True, "complevel": 4, "shuffle": True, "chunks": {"points": 65536}},
+    "raster": {"dtype": "float32", "zlib": True, "complevel": 4, "shuffle": True, "chunks": {"lat": 256, "lon": 256}},
+}
+
+def netcdf_encoding(ds, profile):
+    """
+    Per-variable encoding for ds.to_netcdf from profile, a name in ENCODING_PROFILES or a dict of the same form.
+    Chunks are given per dimension and clipped to the variable shape; only floating point data is cast to dtype.
+    Returns None (no encoding) for profile None.
+    """
+    if profile is None:
+        return None
+    profile = dict(ENCODING_PROFILES[profile] if isinstance(profile, str) else profile)
+    chunks = profile.pop("chunks", {})
+    dtype = profile.pop("dtype", None)
+
+    encoding = {}
+    for name, da in ds.data_vars.items():
+        enc = dict(profile)
+        if dtype is not None and np.issubdtype(da.dtype, np.floating):
+            enc["dtype"] = dtype
+        if da.ndim and all(da.shape):
+            enc["chunksizes"] = tuple(min(chunks.get(dim, size), size) for dim, size in zip(da.dims, da.shape))
+        encoding[name] = enc
+    return encoding
+
+def array_to_gdf(values, lat, lon, columns):
+    """
+    Build a point GeoDataFrame with one column per entry of columns from a (points x columns) array.
+    """
+    gdf = gpd.GeoDataFrame(geometry=gpd.points_from_xy(lon, lat), crs="EPSG:4326")
+    for i, col in enumerate(columns):
+        gdf[f"{col}"] = values[:, i]
+    return gdf
+
+def raster_grid(lon, lat, grid_res):
+    """Regular lon/lat grid with resolution grid_res covering the points, aligned to whole degrees."""
+    lon_min, lon_max = np.floor(lon.min()), np.ceil(lon.max())
+    lat_min, lat_max = np.floor(lat.min()), np.ceil(lat.max())
+    lon_grid = np.arange(lon_min, lon_max + grid_res, grid_res)
+    lat_grid = np.arange(lat_min, lat_max + grid_res, grid_res)
+    return lon_grid, lat_grid
+
+def land_mask_for_grid(lon_grid, lat_grid, shapefile_path, buffer_dist=0.0, all_touched=False):
+    """
+    Boolean (lat, lon) mask of the grid cells whose centers lie on land, from a Natural Earth land shapefile
+    with the land polygons optionally extended by buffer_dist degrees, as in crop_netcdf_to_land.
+    """
+    land_gdf = gpd.read_file(shapefile_path).to_crs("EPSG:4326")
+    geometry = land_gdf.geometry.buffer(buffer_dist) if buffer_dist != 0 else land_gdf.geometry
+
+    lon_res = abs(lon_grid[-1] - lon_grid[0]) / max(len(lon_grid) - 1, 1)
+    lat_res = abs(lat_grid[-1] - lat_grid[0]) / max(len(lat_grid) - 1, 1)
+    # Rasterize north-up and west-to-east, then flip to the order of the grid coordinates
+    transform = from_origin(np.min(lon_grid) - lon_res / 2, np.max(lat_grid) + lat_res / 2, lon_res, lat_res)
+    mask = geometry_mask(geometry, out_shape=(len(lat_grid), len(lon_grid)), transform=transform,
+                         all_touched=all_touched, invert=True)
+    if lat_grid[-1] > lat_grid[0]:
+        mask = mask[::-1]
+    if lon_grid[-1] < lon_grid[0]:
+        mask = mask[:, ::-1]
+    return mask
+
+def cached_land_mask(lon_grid, lat_grid, shapefile_path, buffer_dist=0.0, cache_dir=LAND_MASK_DIR):
+    """
+    Land mask as from land_mask_for_grid, stored in cache_dir as .npy keyed by a hash of the grid, the buffer
+    distance and the shapefile (path, size and modification time), so the land polygons are read and
+    rasterized once per grid definition. The last mask is also kept in memory.
+    """
+    shapefile_path = Path(shapefile_path).resolve()
+    stat = shapefile_path.stat()
+    digest = hashlib.sha1(f"{shapefile_path}:{stat.st_size}:{stat.st_mtime_ns}:{float(buffer_dist)!r}".encode())
+    for arr in (lon_grid, lat_grid):
+        digest.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    key = digest.hexdigest()
+    if key in _land_mask_memo:
+        return _land_mask_memo[key]
+
+    path = Path(cache_dir) / f"land_mask_{key}.npy"
+    if path.exists():
+        mask = np.load(path)
+    else:
+        mask = land_mask_for_grid(lon_grid, lat_grid, shapefile_path, buffer_dist)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+        np.save(tmp_path, mask)
+        os.replace(tmp_path, path)
+        print(f"Saved land mask to {path}")
+
+    _land_mask_memo.clear()
+    _land_mask_memo[key] = mask
+    return mask
+
+def interpolation_weights(lon, lat, lon_grid, lat_grid, method="linear", chunk_size=2000000, mask=None):
+    """
+    Sparse matrix (grid cells x points) that maps point values to the grid cells, in the row-major order of
+    (lat, lon), or to the cells selected by the (lat, lon) boolean mask only. 'linear' uses the barycentric
+    weights of the Delaunay triangle containing each cell, as scipy's griddata; cells outside the convex hull
+    get no entries. 'nearest' picks the closest point.
+    """
+    points = np.column_stack([lon, lat])
+    lon_mesh, lat_mesh = np.meshgrid(lon_grid, lat_grid)
+    cells = np.column_stack([lon_mesh.ravel(), lat_mesh.ravel()])
+    if mask is not None:
+        cells = cells[np.asarray(mask, dtype=bool).ravel()]
+    n_cells = cells.shape[0]
+
+    if method == "nearest":
+        _, idx = cKDTree(points).query(cells)
+        return sparse.csr_matrix((np.ones(n_cells), (np.arange(n_cells), idx)), shape=(n_cells, points.shape[0]))
+    if method != "linear":
+        raise ValueError(f"No interpolation weights for method: {method}")
+
+    tri = Delaunay(points)
+    rows, cols, weights = [], [], []
+    for start in range(0, n_cells, chunk_size):
+        xi = cells[start:start + chunk_size]
+        simplex = tri.find_simplex(xi)
+        inside = np.flatnonzero(simplex >= 0)
+        transform = tri.transform[simplex[inside]]
+        bary = np.einsum("ijk,ik->ij", transform[:, :2], xi[inside] - transform[:, 2])
+        # All three vertices are stored, also with zero weight, so that NaN values propagate as in griddata
+        rows.append(np.repeat(start + inside, 3))
+        cols.append(tri.simplices[simplex[inside]].ravel())
+        weights.append(np.column_stack([bary, 1 - bary.sum(axis=1)]).ravel())
+    return sparse.csr_matrix(
+        (np.concatenate(weights), (np.concatenate(rows), np.concatenate(cols))), shape=(n_cells, points.shape[0])
+    )
+
+def weights_key(lon, lat, lon_grid, lat_grid, method, mask=None):
+    """Hash of the source coordinates, target grid, method and cell mask identifying a set of interpolation weights."""
+    digest = hashlib.sha1(method.encode())
+    for arr in (lon, lat, lon_grid, lat_grid):
+        digest.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+    if mask is not None:
+        digest.update(np.packbits(np.asarray(mask, dtype=bool)).tobytes())
+    return digest.hexdigest()
+
+def cached_interpolation_weights(lon, lat, lon_grid, lat_grid, method="linear", cache_dir=WEIGHTS_DIR, mask=None):
+    """
+    Interpolation weights as from interpolation_weights, stored in cache_dir as sparse .npz keyed by a hash of
+    the coordinates, grid, method and mask, so they are computed once for all products on the same centroids and grid.
+    The last weights are also kept in memory. Without cache_dir, the weights are computed directly.
+    """
+    if cache_dir is None:
+        return interpolation_weights(lon, lat, lon_grid, lat_grid, method, mask=mask)
+    key = weights_key(lon, lat, lon_grid, lat_grid, method, mask)
+    if key in _weights_memo:
+        return _weights_memo[key]
+
+    path = Path(cache_dir) / f"weights_{method}_{key}.npz"
+    if path.exists():
+        weights = sparse.load_npz(path).tocsr()
+    else:
+        weights = interpolation_weights(lon, lat, lon_grid, lat_grid, method, mask=mask)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file first so that concurrent jobs never read a partial file
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        sparse.save_npz(tmp_path, weights, compressed=False)
+        os.replace(tmp_path, path)
+        print(f"Saved interpolation weights to {path}")
+
+    _weights_memo.clear()
+    _weights_memo[key] = weights
+    return weights
+
+def interpolate_to_grid(lon, lat, values, lon_grid, lat_grid, method="linear", weights_cache=WEIGHTS_DIR,
+                        land_mask=None):
+    """
+    Interpolate the columns of values (points x variables) onto the grid, returning (lat, lon, variables).
+    For 'linear' and 'nearest' the interpolation weights are computed once and applied to all variables as a
+    single sparse matrix product, with the weights cached in weights_cache (None to disable); other methods
+    fall back to griddata per variable. With a boolean (lat, lon) land_mask, only the masked cells are
+    interpolated and all others are NaN.
+    """
+    values = np.asarray(values, dtype=float).reshape(len(lon), -1)
+    shape = (len(lat_grid), len(lon_grid), values.shape[1])
+    if land_mask is not None:
+        land_mask = np.asarray(land_mask, dtype=bool)
+        if land_mask.shape != shape[:2]:
+            raise ValueError(f"Land mask of shape {land_mask.shape} does not match the grid of shape {shape[:2]}")
+    cells = land_mask.ravel() if land_mask is not None else slice(None)
+
+    grid_values = np.full((shape[0] * shape[1], shape[2]), np.nan)
+    if method not in ("linear", "nearest"):
+        lon_mesh, lat_mesh = np.meshgrid(lon_grid, lat_grid)
+        xi = (lon_mesh.ravel()[cells], lat_mesh.ravel()[cells])
+        for i in range(values.shape[1]):
+            grid_values[cells, i] = griddata((lon, lat), values[:, i], xi, method=method)
+        return grid_values.reshape(shape)
+
+    weights = cached_interpolation_weights(lon, lat, lon_grid, lat_grid, method, weights_cache, land_mask)
+    cell_values = weights @ values
+    cell_values[np.diff(weights.indptr) == 0] = np.nan
+    grid_values[cells] = cell_values
+    return grid_values.reshape(shape)
+
 def df_to_raster(
     df,
     out_path,
@@ -18,27 +230,33 @@ def df_to_raster(
     method='linear',
     description=None,
     units=None,
+    weights_cache=WEIGHTS_DIR,
+    encoding="raster",
+    land_mask=None,
+    shapefile_path=None,
+    buffer_dist=0.0,
 ):
     """
     Interpolate hazard metric data from a DataFrame with lat/lon to a regular grid and save as NetCDF.
+    With land_mask (see land_mask_for_grid) or a land shapefile_path, from which the mask of the grid is built
+    with cached_land_mask, only land cells are interpolated and ocean cells are NaN.
     """
     lon = df["lon"].values
     lat = df["lat"].values
-
-    lon_min, lon_max = np.floor(lon.min()), np.ceil(lon.max())
-    lat_min, lat_max = np.floor(lat.min()), np.ceil(lat.max())
-    lon_grid = np.arange(lon_min, lon_max + grid_res, grid_res)
-    lat_grid = np.arange(lat_min, lat_max + grid_res, grid_res)
-    lon_mesh, lat_mesh = np.meshgrid(lon_grid, lat_grid)
+    lon_grid, lat_grid = raster_grid(lon, lat, grid_res)
+    if land_mask is None and shapefile_path is not None:
+        land_mask = cached_land_mask(lon_grid, lat_grid, shapefile_path, buffer_dist)
 
     coords = {"lon": lon_grid, "lat": lat_grid}
     interpolated_vars = {}
 
     numeric_cols = df.select_dtypes(include=["number"]).columns.difference(["lat", "lon"])
+    all_grid_values = interpolate_to_grid(
+        lon, lat, df[numeric_cols].to_numpy(), lon_grid, lat_grid, method, weights_cache, land_mask
+    )
 
-    for col in numeric_cols:
-        values = df[col].values
-        grid_values = griddata((lon, lat), values, (lon_mesh, lat_mesh), method=method)
+    for i, col in enumerate(numeric_cols):
+        grid_values = all_grid_values[:, :, i]
 
         var_name = f"{variable_prefix}_{col}".replace(".", "p")
         da = xr.DataArray(grid_values, dims=("lat", "lon"), coords=coords)
@@ -51,7 +269,7 @@ def df_to_raster(
         interpolated_vars[var_name] = da
 
     ds = xr.Dataset(interpolated_vars)
-    ds.to_netcdf(out_path)
+    ds.to_netcdf(out_path, encoding=netcdf_encoding(ds, encoding))
     print(f"Saved rasterized NetCDF to: {out_path}")
 
 def gdf_to_raster(
@@ -62,28 +280,34 @@ def gdf_to_raster(
     method='linear',
     description=None,
     units=None,
+    weights_cache=WEIGHTS_DIR,
+    encoding="raster",
+    land_mask=None,
+    shapefile_path=None,
+    buffer_dist=0.0,
 ):
     """
     Interpolate hazard metric data from a GeoDataFrame onto a regular grid and save as NetCDF.
-    No cropping to land; this step should be done separately.
+    No cropping to land; this step should be done separately, or pass a land shapefile_path (with optional
+    buffer_dist in degrees) or a land_mask on the grid of raster_grid to interpolate land cells only and leave
+    ocean cells NaN. The mask of a shapefile is built once per grid and cached (see cached_land_mask).
     """
     lon = gdf.geometry.x.values
     lat = gdf.geometry.y.values
-
-    lon_min, lon_max = np.floor(lon.min()), np.ceil(lon.max())
-    lat_min, lat_max = np.floor(lat.min()), np.ceil(lat.max())
-    lon_grid = np.arange(lon_min, lon_max + grid_res, grid_res)
-    lat_grid = np.arange(lat_min, lat_max + grid_res, grid_res)
-    lon_mesh, lat_mesh = np.meshgrid(lon_grid, lat_grid)
+    lon_grid, lat_grid = raster_grid(lon, lat, grid_res)
+    if land_mask is None and shapefile_path is not None:
+        land_mask = cached_land_mask(lon_grid, lat_grid, shapefile_path, buffer_dist)
 
     coords = {"lon": lon_grid, "lat": lat_grid}
     interpolated_vars = {}
 
     numeric_cols = gdf.select_dtypes(include=['number']).columns
+    all_grid_values = interpolate_to_grid(
+        lon, lat, gdf[numeric_cols].to_numpy(), lon_grid, lat_grid, method, weights_cache, land_mask
+    )
 
-    for col in numeric_cols:
-        values = gdf[col].values
-        grid_values = griddata((lon, lat), values, (lon_mesh, lat_mesh), method=method)
+    for i, col in enumerate(numeric_cols):
+        grid_values = all_grid_values[:, :, i]
 
         var_name = f"{variable_prefix}_{col}".replace(".", "p")
         da = xr.DataArray(grid_values, dims=("lat", "lon"), coords=coords)
@@ -97,10 +321,11 @@ def gdf_to_raster(
         interpolated_vars[var_name] = da
 
     ds = xr.Dataset(interpolated_vars)
-    ds.to_netcdf(out_path)
+    ds.to_netcdf(out_path, encoding=netcdf_encoding(ds, encoding))
     print(f"Saved gridded raster NetCDF to {out_path}")
     
-def gdf_to_netcdf(gdf, out_path, variable_prefix='hazard_metric', description=None, units=None, also_csv=True):
+def gdf_to_netcdf(gdf, out_path, variable_prefix='hazard_metric', description=None, units=None, also_csv=True,
+                  encoding="point"):
     """
     Save GeoDataFrame with hazard metrics as NetCDF (and optionally CSV).
     """
@@ -130,7 +355,7 @@ def gdf_to_netcdf(gdf, out_path, variable_prefix='hazard_metric', description=No
 
         ds[var_name] = data_array
 
-    ds.to_netcdf(out_path)
+    ds.to_netcdf(out_path, encoding=netcdf_encoding(ds, encoding))
     print(f"Saved NetCDF to {out_path}")
 
     if also_csv:
@@ -144,9 +369,35 @@ def gdf_to_netcdf(gdf, out_path, variable_prefix='hazard_metric', description=No
         print(f"Saved CSV to {csv_path}")
 
 
-def crop_netcdf_to_land(input_nc, output_nc, shapefile_path, buffer_dist=0.0):
+def write_metric_maps(gdf, out_dir, fname_base, variable, grid_res=0.05, shapefile_path=None, buffer_dist=0.0):
     """
-    Crop a rasterized NetCDF file to land-only points using a Natural Earth shapefile.
+    Save the point NetCDF/CSV and the gridded raster NetCDF of one metric family
+    ('exceedance_intensity' or 'return_periods') with the standard names and metadata,
+    optionally rasterizing only the land cells of a land shapefile (see gdf_to_raster).
+    """
+    if variable == "exceedance_intensity":
+        prefix, units = "rp", "m/s"
+        description = {col: f"Exceedance intensity for RP={col} years" for col in gdf.columns if col != "geometry"}
+    elif variable == "return_periods":
+        prefix, units = "thr", "years"
+        description = {col: f"Return period for intensity \u2265 {col} m/s" for col in gdf.columns if col != "geometry"}
+    else:
+        raise ValueError(f"Unknown variable type: {variable}")
+
+    out_dir = Path(out_dir)
+    gdf_to_netcdf(gdf, out_dir / f"{fname_base}_{variable}.nc", variable_prefix=prefix,
+                  description=description, units=units)
+    gdf_to_raster(gdf, out_dir / f"{fname_base}_{variable}_raster.nc", variable_prefix=prefix,
+                  grid_res=grid_res, method="linear", description=description, units=units,
+                  shapefile_path=shapefile_path, buffer_dist=buffer_dist)
+
+
+def crop_netcdf_to_land(input_nc, output_nc, shapefile_path, buffer_dist=0.0, mask_cache=LAND_MASK_DIR,
+                        encoding="raster"):
+    """
+    Crop a rasterized NetCDF file to land-only points using a Natural Earth shapefile. The land polygons are
+    rasterized once per grid and buffer distance (see cached_land_mask); cropping then sets all cells off
+    land to NaN and drops the rows and columns outside the bounding box of the land cells.
 
     Parameters:
     -----------
@@ -158,20 +409,32 @@ def crop_netcdf_to_land(input_nc, output_nc, shapefile_path, buffer_dist=0.0):
         Path to the Natural Earth land shapefile (e.g., ne_10m_land.shp).
     buffer_dist : float
         Buffer distance in degrees to optionally extend land polygons.
+    mask_cache : Path or None
+        Directory of cached land masks, None to rasterize the land polygons without caching.
+    encoding : str or dict
+        NetCDF encoding profile of the output (see ENCODING_PROFILES), None to keep the input encoding.
     """
     
     ds = xr.open_dataset(input_nc)
-    ds = ds.rio.write_crs("EPSG:4326", inplace=True)
-    ds.rio.set_spatial_dims(x_dim='lon', y_dim='lat', inplace=True)
-
-    land_gdf = gpd.read_file(shapefile_path).to_crs("EPSG:4326")
-    if buffer_dist != 0:
-        land_gdf["geometry"] = land_gdf.geometry.buffer(buffer_dist)
-
-    ds_clipped = ds.rio.clip(land_gdf.geometry, land_gdf.crs, drop=True)
+    lon_grid, lat_grid = ds["lon"].values, ds["lat"].values
+    if mask_cache is None:
+        mask = land_mask_for_grid(lon_grid, lat_grid, shapefile_path, buffer_dist)
+    else:
+        mask = cached_land_mask(lon_grid, lat_grid, shapefile_path, buffer_dist, mask_cache)
+
+    rows, cols = np.flatnonzero(mask.any(axis=1)), np.flatnonzero(mask.any(axis=0))
+    if rows.size == 0:
+        raise ValueError(f"No land cells within the grid of {input_nc}")
+    land = xr.DataArray(mask, dims=("lat", "lon"), coords={"lat": lat_grid, "lon": lon_grid})
+
+    ds_clipped = ds.copy()
+    for name, da in ds.data_vars.items():
+        if "lat" in da.dims and "lon" in da.dims:
+            ds_clipped[name] = da.where(land)
+    ds_clipped = ds_clipped.isel(lat=slice(rows[0], rows[-1] + 1), lon=slice(cols[0], cols[-1] + 1))
 
     if "spatial_ref" in ds_clipped.coords:
         ds_clipped = ds_clipped.drop_vars("spatial_ref")
 
-    ds_clipped.to_netcdf(output_nc)
+    ds_clipped.to_netcdf(output_nc, encoding=netcdf_encoding(ds_clipped, encoding))
     print(f"Successfully saved land-cropped NetCDF to {output_nc}")
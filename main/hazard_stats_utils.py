@@ -0,0 +1,488 @@
+# hazard_stats_utils.py
+"""
+Vectorized local hazard statistics computed directly on the sparse intensity matrix.
+
+The results follow climada's Hazard.local_exceedance_intensity and Hazard.local_return_period
+with log-log interpolation and method 'extrapolate_constant', but all centroids of a block are
+processed at once with array operations and plain arrays are returned. Other climada methods are
+rejected: 'interpolate' differs for centroids with one or no nonzero intensity and when grouping
+equal intensities, and is not reproduced here.
+"""
+
+import json
+import numpy as np
+from pathlib import Path
+from collections import namedtuple
+from scipy import sparse
+
+RETURN_PERIODS = [10, 25, 50, 100, 250, 1000]
+THRESHOLDS = [33, 50]
+
+# Per-centroid exceedance curves: the intensities of centroid i are intensity[indptr[i]:indptr[i+1]],
+# unique and sorted in descending order, with the summed frequency of the events at each intensity
+ExceedanceCurves = namedtuple("ExceedanceCurves", ["indptr", "intensity", "frequency"])
+
+# On-disk exceedance index: the curves of all centroids of a hazard with their cumulative exceedance
+# frequencies, stored as flat .npy arrays that are memory-mapped for queries
+ExceedanceIndex = namedtuple("ExceedanceIndex", ["indptr", "intensity", "cum_freq", "lat", "lon", "meta"])
+INDEX_ARRAYS = ["indptr", "intensity", "cum_freq", "lat", "lon"]
+
+# Extrapolation methods of climada's local statistics that the kernels reproduce
+METHODS = ["extrapolate_constant"]
+
+
+def _group_sorted(seg, values, weights, n_seg):
+    """Build curves from entries sorted by segment and descending value, grouping equal values."""
+    new = np.ones(values.size, dtype=bool)
+    new[1:] = (seg[1:] != seg[:-1]) | (values[1:] != values[:-1])
+    starts = np.flatnonzero(new)
+    weights = np.add.reduceat(weights, starts) if starts.size else weights[:0]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(seg[starts], minlength=n_seg))])
+    return ExceedanceCurves(indptr, values[starts], weights)
+
+
+def exceedance_curves(intensity, frequency, min_intensity=0.0):
+    """
+    Build the exceedance curves of all centroids of an (events x centroids) sparse intensity matrix:
+    per centroid, the intensities above min_intensity in descending order, events of equal intensity
+    grouped and their frequencies summed.
+    """
+    mat = sparse.csc_matrix(intensity)
+    n_cen = mat.shape[1]
+    seg = np.repeat(np.arange(n_cen), np.diff(mat.indptr))
+    keep = mat.data > min_intensity
+    seg, values, freq = seg[keep], mat.data[keep], np.asarray(frequency)[mat.indices[keep]]
+
+    order = np.lexsort((-values, seg))
+    return _group_sorted(seg[order], values[order], freq[order], n_cen)
+
+
+def exceedance_curves_blocked(intensity, frequency, min_intensity=0.0, block_size=50000):
+    """Exceedance curves of all centroids, built in blocks of block_size centroids to bound temporary memory."""
+    mat = sparse.csc_matrix(intensity)
+    n_cen = mat.shape[1]
+    indptr, values, freq = [np.zeros(1, dtype=np.int64)], [], []
+    for c_0 in range(0, n_cen, block_size):
+        curves = exceedance_curves(mat[:, c_0:min(c_0 + block_size, n_cen)], frequency, min_intensity)
+        indptr.append(curves.indptr[1:] + indptr[-1][-1])
+        values.append(curves.intensity)
+        freq.append(curves.frequency)
+    return ExceedanceCurves(np.concatenate(indptr), np.concatenate(values), np.concatenate(freq))
+
+
+def cumulative_frequency(curves):
+    """Exceedance frequency at each intensity of the curves: summed frequency of all events at least as intense."""
+    cum_freq = np.cumsum(curves.frequency)
+    offset = np.concatenate([[0], cum_freq])[curves.indptr[:-1]]
+    return cum_freq - np.repeat(offset, np.diff(curves.indptr))
+
+
+def _cumulative_counts(indptr, values, queries, side):
+    """
+    Search sorted queries in every segment at once: returns the (segments x queries) number of segment
+    values v with v <= q (side 'left') or v < q (side 'right'), for every query q.
+    """
+    n_seg, n_q = indptr.size - 1, len(queries)
+    seg = np.repeat(np.arange(n_seg), np.diff(indptr))
+    pos = np.searchsorted(queries, values, side=side)
+    counts = np.bincount(seg * (n_q + 1) + pos, minlength=n_seg * (n_q + 1)).reshape(n_seg, n_q + 1)
+    return np.cumsum(counts, axis=1)[:, :n_q]
+
+
+def _check_method(method):
+    """Raise a ValueError for methods whose climada results the kernels do not reproduce (see METHODS)."""
+    if method not in METHODS:
+        raise ValueError(f"Unsupported method: {method}, use one of {METHODS}")
+
+
+def curves_exceedance_intensity(curves, return_periods, method="extrapolate_constant", cum_freq=None):
+    """
+    Exceedance intensity of every centroid of the curves for the given return periods, interpolated
+    log-log between the exceedance frequencies. Beyond the largest intensity, the largest intensity is
+    kept; return periods shorter than covered by the curve, and centroids without intensity, give 0
+    (climada's 'extrapolate_constant'). The cumulative frequencies of the curves are computed unless
+    given as cum_freq. Returns an array (centroids x return periods).
+    """
+    _check_method(method)
+
+    return_periods = np.asarray(return_periods, dtype=float)
+    order = np.argsort(1 / return_periods)
+    test_freq = (1 / return_periods)[order]
+
+    indptr = curves.indptr
+    start, n_pts = indptr[:-1, None], np.diff(indptr)[:, None]
+    if cum_freq is None:
+        cum_freq = cumulative_frequency(curves)
+    x, y = np.log10(cum_freq), np.log10(curves.intensity)
+    x_test = np.log10(test_freq)[None, :]
+
+    # Number of curve points with exceedance frequency <= test frequency
+    k = _cumulative_counts(indptr, cum_freq, test_freq, side="left")
+    i_lo = np.clip(start + k - 1, 0, None)
+    i_hi = np.clip(start + k, 0, max(x.size - 1, 0))
+
+    result = np.zeros(k.shape)
+    if x.size:
+        x_lo, x_hi, y_lo, y_hi = x[i_lo], x[i_hi], y[i_lo], y[i_hi]
+        inside = (k > 0) & (k < n_pts)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            y_interp = np.power(10.0, y_lo + (x_test - x_lo) * (y_hi - y_lo) / (x_hi - x_lo))
+        result = np.where(inside, y_interp, result)
+
+        # Test frequency equal to the largest exceedance frequency of the curve
+        at_end = (k == n_pts) & (n_pts > 0) & (cum_freq[i_lo] == test_freq)
+        result = np.where(at_end, np.power(10.0, y_lo), result)
+
+        # Rarer than the largest intensity
+        y_max = np.power(10.0, y[np.clip(indptr[:-1], 0, x.size - 1)])[:, None]
+        below = (k == 0) & (n_pts > 0)
+        result = np.where(below, y_max, result)
+
+    out = np.empty_like(result)
+    out[:, order] = result
+    return out
+
+
+def curves_return_period(curves, thresholds, method="extrapolate_constant", cum_freq=None):
+    """
+    Return period of every centroid of the curves for the given threshold intensities, with the exceedance
+    frequency interpolated log-log between the curve intensities. Thresholds above the largest intensity,
+    and centroids without intensity, give NaN; below the smallest intensity, its return period is kept
+    (climada's 'extrapolate_constant'). The cumulative frequencies of the curves are computed unless
+    given as cum_freq. Returns an array (centroids x thresholds).
+    """
+    _check_method(method)
+
+    thresholds = np.asarray(thresholds, dtype=float)
+    order = np.argsort(thresholds)
+    test_int = thresholds[order]
+
+    indptr = curves.indptr
+    start, n_pts = indptr[:-1, None], np.diff(indptr)[:, None]
+    if cum_freq is None:
+        cum_freq = cumulative_frequency(curves)
+    x, y = np.log10(cum_freq), np.log10(curves.intensity)
+    with np.errstate(divide="ignore"):
+        y_test = np.log10(test_int)[None, :]
+
+    # Number of curve points with intensity >= threshold, all of them exceeded at the threshold
+    m = n_pts - _cumulative_counts(indptr, curves.intensity, test_int, side="right")
+    i_lo = np.clip(start + m - 1, 0, max(x.size - 1, 0))
+    i_hi = np.clip(start + m, 0, max(x.size - 1, 0))
+
+    result = np.full(m.shape, np.nan)
+    if x.size:
+        x_lo, x_hi, y_lo, y_hi = x[i_lo], x[i_hi], y[i_lo], y[i_hi]
+        inside = (m > 0) & (m < n_pts)
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            rp_interp = 1 / np.power(10.0, x_lo + (y_test - y_lo) * (x_hi - x_lo) / (y_hi - y_lo))
+        result = np.where(inside, rp_interp, result)
+
+        # Threshold at or below the smallest intensity of the curve
+        below = (m == n_pts) & (n_pts > 0)
+        result = np.where(below, 1 / np.power(10.0, x_lo), result)
+
+    out = np.empty_like(result)
+    out[:, order] = result
+    return out
+
+
+def _map_curve_blocks(func, intensity, frequency, n_out, min_intensity, block_size):
+    """Build the curves of blocks of block_size centroids from the CSC intensity matrix and stack func(curves)."""
+    mat = sparse.csc_matrix(intensity)
+    n_cen = mat.shape[1]
+    result = np.empty((n_cen, n_out))
+    for c_0 in range(0, n_cen, block_size):
+        c_1 = min(c_0 + block_size, n_cen)
+        result[c_0:c_1] = func(exceedance_curves(mat[:, c_0:c_1], frequency, min_intensity))
+    return result
+
+
+def exceedance_intensity(intensity, frequency, return_periods=RETURN_PERIODS, min_intensity=0.0,
+                         method="extrapolate_constant", block_size=50000):
+    """
+    Local exceedance intensity of every centroid for the given return periods, computed on the CSC form of
+    the (events x centroids) intensity matrix in blocks of block_size centroids.
+    Returns an array (centroids x return periods).
+    """
+    _check_method(method)
+    return _map_curve_blocks(
+        lambda curves: curves_exceedance_intensity(curves, return_periods, method),
+        intensity, frequency, len(return_periods), min_intensity, block_size
+    )
+
+
+def return_period(intensity, frequency, thresholds=THRESHOLDS, min_intensity=0.0,
+                  method="extrapolate_constant", block_size=50000):
+    """
+    Local return period of every centroid for the given threshold intensities, computed on the CSC form of
+    the (events x centroids) intensity matrix in blocks of block_size centroids. All thresholds are evaluated
+    in one pass over the sorted intensities, so dense sweeps (full hazard curves) cost about as much as a few
+    thresholds. Returns an array (centroids x thresholds).
+    """
+    _check_method(method)
+    return _map_curve_blocks(
+        lambda curves: curves_return_period(curves, thresholds, method),
+        intensity, frequency, len(thresholds), min_intensity, block_size
+    )
+
+
+def hazard_statistics(intensity, frequency, return_periods=RETURN_PERIODS, thresholds=THRESHOLDS, min_intensity=0.0,
+                      method="extrapolate_constant", block_size=50000):
+    """
+    Local exceedance intensity for return_periods and return period for thresholds of every centroid, both
+    computed from the same per-centroid curves so that the intensities are sorted only once.
+    Returns the arrays (centroids x return periods) and (centroids x thresholds).
+    """
+    _check_method(method)
+    stats = _map_curve_blocks(
+        lambda curves: curves_statistics(curves, return_periods, thresholds, method),
+        intensity, frequency, len(return_periods) + len(thresholds), min_intensity, block_size
+    )
+    return stats[:, :len(return_periods)], stats[:, len(return_periods):]
+
+
+def curves_statistics(curves, return_periods=RETURN_PERIODS, thresholds=THRESHOLDS, method="extrapolate_constant"):
+    """Exceedance intensities and return periods of the curves, stacked column-wise."""
+    cum_freq = cumulative_frequency(curves)
+    return np.hstack([
+        curves_exceedance_intensity(curves, return_periods, method, cum_freq=cum_freq),
+        curves_return_period(curves, thresholds, method, cum_freq=cum_freq)
+    ])
+
+
+def threshold_sweep(start, stop, step=1.0):
+    """Threshold intensities from start to stop (inclusive) in steps of step."""
+    return np.round(np.arange(start, stop + step / 2, step), 6)
+
+
+def build_exceedance_index(intensity, frequency, lat, lon, min_intensity=0.0, block_size=50000):
+    """Compute the exceedance index of all centroids of an (events x centroids) intensity matrix."""
+    curves = exceedance_curves_blocked(intensity, frequency, min_intensity, block_size)
+    meta = {"n_events": int(intensity.shape[0]), "n_centroids": int(intensity.shape[1]),
+            "min_intensity": float(min_intensity)}
+    return ExceedanceIndex(curves.indptr, curves.intensity, cumulative_frequency(curves),
+                           np.asarray(lat), np.asarray(lon), meta)
+
+
+def index_dir_for(hazard_file):
+    """Default location of the exceedance index of a hazard file, next to the file."""
+    return Path(hazard_file).with_suffix(".exceedance_index")
+
+
+def write_exceedance_index(index_dir, index, **meta):
+    """
+    Write the index arrays as .npy files; meta.json marks the index as complete. It is removed before the
+    arrays are (re)written and renamed into place last, so an interrupted rebuild never looks complete.
+    """
+    index_dir = Path(index_dir)
+    index_dir.mkdir(parents=True, exist_ok=True)
+    (index_dir / "meta.json").unlink(missing_ok=True)
+    for name in INDEX_ARRAYS:
+        np.save(index_dir / f"{name}.npy", getattr(index, name))
+    tmp_file = index_dir / "meta.json.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump({**index.meta, **meta}, f, indent=1)
+    tmp_file.replace(index_dir / "meta.json")
+    print(f"Saved exceedance index to {index_dir}")
+
+
+def check_index_source(meta):
+    """Raise if the hazard file an index was built from (source_file in meta) has changed since, by size or mtime."""
+    if "source_file" not in meta or not Path(meta["source_file"]).exists():
+        return
+    stat = Path(meta["source_file"]).stat()
+    if (stat.st_size, stat.st_mtime_ns) != (meta.get("source_size"), meta.get("source_mtime_ns")):
+        raise ValueError(f"Exceedance index is stale: {meta['source_file']} changed after the index was built")
+
+
+def open_exceedance_index(index_dir, mmap_mode="r", check_source=True):
+    """
+    Open an exceedance index with memory-mapped arrays; only the pages of queried centroids are read.
+    With check_source, an index whose source hazard file has changed since it was built is rejected.
+    """
+    index_dir = Path(index_dir)
+    if not (index_dir / "meta.json").exists():
+        raise FileNotFoundError(f"No complete exceedance index in {index_dir}")
+    with open(index_dir / "meta.json") as f:
+        meta = json.load(f)
+    if check_source:
+        check_index_source(meta)
+    arrays = {name: np.load(index_dir / f"{name}.npy", mmap_mode=mmap_mode) for name in INDEX_ARRAYS}
+    return ExceedanceIndex(meta=meta, **arrays)
+
+
+def index_extent_mask(index, extent):
+    """Centroids of the index within extent (lon_min, lon_max, lat_min, lat_max)."""
+    lon_min, lon_max, lat_min, lat_max = extent
+    return (index.lon >= lon_min) & (index.lon <= lon_max) & (index.lat >= lat_min) & (index.lat <= lat_max)
+
+
+def _index_curves(index, centroids=None):
+    """Gather the curves and cumulative frequencies of the selected centroids (indices or mask) of the index."""
+    if centroids is None:
+        return ExceedanceCurves(np.asarray(index.indptr), index.intensity, None), index.cum_freq
+    centroids = np.asarray(centroids)
+    if centroids.dtype == bool:
+        centroids = np.flatnonzero(centroids)
+    starts = np.asarray(index.indptr[centroids])
+    n_pts = np.asarray(index.indptr[centroids + 1]) - starts
+    indptr = np.concatenate([[0], np.cumsum(n_pts)])
+    idx = np.repeat(starts - indptr[:-1], n_pts) + np.arange(indptr[-1])
+    return ExceedanceCurves(indptr, np.asarray(index.intensity[idx]), None), np.asarray(index.cum_freq[idx])
+
+
+def index_exceedance_intensity(index, return_periods=RETURN_PERIODS, centroids=None, method="extrapolate_constant"):
+    """Exceedance intensity of the selected centroids (indices or mask, default all) from an exceedance index."""
+    curves, cum_freq = _index_curves(index, centroids)
+    return curves_exceedance_intensity(curves, return_periods, method, cum_freq=cum_freq)
+
+
+def index_return_period(index, thresholds=THRESHOLDS, centroids=None, method="extrapolate_constant"):
+    """Return period of the selected centroids (indices or mask, default all) from an exceedance index."""
+    curves, cum_freq = _index_curves(index, centroids)
+    return curves_return_period(curves, thresholds, method, cum_freq=cum_freq)
+
+
+def top_k_size(frequency, return_periods=RETURN_PERIODS, margin=16):
+    """
+    Number of most intense events per centroid that determine the exceedance intensities of all return
+    periods: enough events of the smallest frequency to reach the shortest return period, plus a margin.
+    """
+    frequency = np.asarray(frequency)
+    min_freq = frequency[frequency > 0].min()
+    k = int(np.ceil(np.max(1 / np.asarray(return_periods, dtype=float)) / min_freq)) + 1 + margin
+    return min(k, frequency.size)
+
+
+def stream_top_k(chunks, frequency, n_centroids, k, min_intensity=0.0):
+    """
+    Build exceedance curves from a stream of (first event index, sparse event chunk) keeping only the k most
+    intense events per centroid, so that memory scales with centroids x k instead of the number of events.
+    Where events were discarded, the lowest intensity kept is dropped as well since events tied with it may
+    be missing; the remaining curve points are exact.
+    """
+    frequency = np.asarray(frequency)
+    seg, values, freq = np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)
+    truncated = np.zeros(n_centroids, dtype=bool)
+    for row_0, chunk in chunks:
+        coo = chunk.tocoo()
+        keep = coo.data > min_intensity
+        seg = np.concatenate([seg, coo.col[keep]])
+        values = np.concatenate([values, coo.data[keep]])
+        freq = np.concatenate([freq, frequency[row_0 + coo.row[keep]]])
+
+        order = np.lexsort((-values, seg))
+        seg, values, freq = seg[order], values[order], freq[order]
+        first = np.concatenate([[0], np.cumsum(np.bincount(seg, minlength=n_centroids))])[seg]
+        over = np.arange(seg.size) - first >= k
+        truncated[seg[over]] = True
+        seg, values, freq = seg[~over], values[~over], freq[~over]
+
+    if seg.size:
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(seg, minlength=n_centroids))])
+        last = values[np.clip(indptr[1:] - 1, 0, None)]
+        keep = ~(truncated[seg] & (values == last[seg]))
+        seg, values, freq = seg[keep], values[keep], freq[keep]
+    return _group_sorted(seg, values, freq, n_centroids)
+
+
+def merge_curves(curves_a, curves_b):
+    """Merge the exceedance curves of two event sets over the same centroids into the curves of their union."""
+    if curves_a is None:
+        return curves_b
+    n_seg = curves_a.indptr.size - 1
+    seg = np.concatenate([np.repeat(np.arange(n_seg), np.diff(curves.indptr)) for curves in (curves_a, curves_b)])
+    values = np.concatenate([curves_a.intensity, curves_b.intensity])
+    freq = np.concatenate([curves_a.frequency, curves_b.frequency])
+    order = np.lexsort((-values, seg))
+    return _group_sorted(seg[order], values[order], freq[order], n_seg)
+
+
+def truncate_curves(curves, return_periods=None, thresholds=None):
+    """
+    Drop the curve points that cannot affect the exceedance intensities of return_periods or the return
+    periods of thresholds, even after more events are merged: points past the first one whose exceedance
+    frequency reaches the shortest return period, or past the first one below the lowest threshold.
+    """
+    n_pts = np.diff(curves.indptr)
+    rank = np.arange(curves.intensity.size) - np.repeat(curves.indptr[:-1], n_pts)
+    keep = np.zeros(curves.intensity.size, dtype=bool)
+    if return_periods is not None:
+        freq_before = cumulative_frequency(curves) - curves.frequency
+        keep |= freq_before < np.max(1 / np.asarray(return_periods, dtype=float))
+    if thresholds is not None:
+        n_above = n_pts - _cumulative_counts(curves.indptr, curves.intensity, [np.min(thresholds)], side="right")[:, 0]
+        keep |= rank <= np.repeat(n_above, n_pts)
+    seg = np.repeat(np.arange(n_pts.size), n_pts)[keep]
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(seg, minlength=n_pts.size))])
+    return ExceedanceCurves(indptr, curves.intensity[keep], curves.frequency[keep])
+
+
+def stream_curves(chunks, frequency, columns=None, min_intensity=0.0, curves=None, return_periods=None,
+                  thresholds=None):
+    """
+    Merge a stream of (first event index, sparse event chunk) into exceedance curves, optionally restricted to
+    the centroid columns and starting from the curves of previous event sets. After each chunk the curves are
+    truncated to the points needed for return_periods or thresholds, so memory does not grow with the events.
+    """
+    frequency = np.asarray(frequency)
+    for row_0, chunk in chunks:
+        if columns is not None:
+            chunk = chunk[:, columns]
+        chunk_curves = exceedance_curves(chunk, frequency[row_0:row_0 + chunk.shape[0]], min_intensity)
+        curves = merge_curves(curves, chunk_curves)
+        if return_periods is not None or thresholds is not None:
+            curves = truncate_curves(curves, return_periods, thresholds)
+    return curves
+
+
+def bootstrap_weights(n_groups, n_boot, seed=None):
+    """Multinomial weights (resamples x groups): how often each group is drawn when resampling groups with replacement."""
+    rng = np.random.default_rng(seed)
+    return rng.multinomial(n_groups, np.full(n_groups, 1 / n_groups), size=n_boot)
+
+
+def bootstrap_exceedance_intensity(intensity, frequency, groups, return_periods=RETURN_PERIODS, n_boot=200,
+                                   percentiles=(5, 50, 95), min_intensity=0.0, method="extrapolate_constant",
+                                   seed=None, max_entries=50000000):
+    """
+    Bootstrap percentiles of the local exceedance intensity, resampling the event groups (e.g. years) with
+    replacement. Each resample scales the event frequencies by the number of draws of their group;
+    the curves of all resamples of a block of centroids are evaluated together as (resample, centroid) segments,
+    with blocks sized so that at most max_entries curve points are processed at once.
+    Returns an array (percentiles x centroids x return periods).
+    """
+    _check_method(method)
+    groups = np.asarray(groups)
+    frequency = np.asarray(frequency)
+    _, group_idx = np.unique(groups, return_inverse=True)
+    weights = bootstrap_weights(group_idx.max() + 1, n_boot, seed)
+
+    mat = sparse.csc_matrix(intensity)
+    n_cen = mat.shape[1]
+    result = np.empty((len(percentiles), n_cen, len(return_periods)))
+    cum_nnz = np.concatenate([[0], np.cumsum(np.diff(mat.indptr))])
+    c_0 = 0
+    while c_0 < n_cen:
+        c_1 = max(np.searchsorted(cum_nnz, cum_nnz[c_0] + max_entries / n_boot, side="right") - 1, c_0 + 1)
+        c_1 = min(c_1, n_cen)
+        block = mat[:, c_0:c_1]
+        n_blk = c_1 - c_0
+        seg = np.repeat(np.arange(n_blk), np.diff(block.indptr))
+        keep = block.data > min_intensity
+        seg, values, event = seg[keep], block.data[keep], block.indices[keep]
+        order = np.lexsort((-values, seg))
+        seg, values, event = seg[order], values[order], event[order]
+
+        # Entries of all resamples, ordered by resample and centroid with descending intensities
+        freq = (frequency[event] * weights[:, group_idx[event]]).ravel()
+        seg = (np.arange(n_boot)[:, None] * n_blk + seg).ravel()
+        values = np.tile(values, n_boot)
+        drawn = freq > 0
+        curves = _group_sorted(seg[drawn], values[drawn], freq[drawn], n_boot * n_blk)
+
+        exceed = curves_exceedance_intensity(curves, return_periods, method).reshape(n_boot, n_blk, -1)
+        result[:, c_0:c_1] = np.percentile(exceed, percentiles, axis=0)
+        c_0 = c_1
+    return result
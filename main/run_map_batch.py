@@ -0,0 +1,142 @@
+import sys
+import argparse
+import itertools
+import rioxarray
+import numpy as np
+from climada.util.constants import SYSTEM_DIR
+from climada.hazard import TropCyclone
+
+sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
+from main.hazard_map_utils import array_to_gdf, write_metric_maps
+from main.hazard_io_utils import LRUCache, read_centroids, centroids_key, load_hazard_tile
+from main.hazard_stats_utils import (
+    RETURN_PERIODS, THRESHOLDS, exceedance_curves_blocked, merge_curves, truncate_curves, curves_statistics,
+    threshold_sweep
+)
+
+MODELS = ["CESM2", "CNRM-CM6-1", "EC-Earth3", "IPSL-CM6A-LR", "MIROC6", "UKESM1-0-LL"]
+METRICS = ["exceedance_intensity", "return_periods"]
+
+class MapBatch:
+    """
+    Compute map products in one process, keeping loaded hazards, the shared centroids and the per-centroid
+    exceedance curves in a memory-bounded LRU cache so that every hazard file is read once.
+    """
+
+    def __init__(self, extent=None, max_gb=64, return_periods=RETURN_PERIODS, thresholds=THRESHOLDS,
+                 shapefile_path=None, buffer_dist=0.0):
+        self.extent = extent
+        self.shapefile_path = shapefile_path
+        self.buffer_dist = buffer_dist
+        self.cache = LRUCache(max_gb * 1e9)
+        self.return_periods = return_periods
+        self.thresholds = thresholds
+        self.haz_dir = SYSTEM_DIR / "hazard" / "future" / "CHAZ"
+        self.out_dir = self.haz_dir / "maps"
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        self._centroids = {}
+        self._file_keys = {}
+
+    def hazard_file(self, model, scenario, period, cat, wind):
+        return self.haz_dir / f"TC_global_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5"
+
+    def centroids_key(self, file):
+        """Hash of the centroid coordinates of file (see centroids_key), once per file; new coordinates are read as Centroids."""
+        if str(file) not in self._file_keys:
+            key = centroids_key(file)
+            if key not in self._centroids:
+                centroids = read_centroids(file)
+                sel_cen = (centroids.select_mask(extent=self.extent) if self.extent
+                           else np.ones(centroids.size, dtype=bool))
+                self._centroids[key] = (centroids, sel_cen)
+            self._file_keys[str(file)] = key
+        return self._file_keys[str(file)]
+
+    def centroids(self, file):
+        """Centroids of file and the selected centroid mask, shared by all files with the same centroid coordinates."""
+        return self._centroids[self.centroids_key(file)]
+
+    def hazard(self, file):
+        centroids, sel_cen = self.centroids(file)
+        return self.cache.get(("hazard", str(file)),
+                              lambda: load_hazard_tile(file, sel_cen=sel_cen, centroids=centroids))
+
+    def curves(self, file):
+        """Per-centroid exceedance curves of the hazard file within the extent."""
+        def build():
+            hazard = self.hazard(file)
+            return exceedance_curves_blocked(hazard.intensity, hazard.frequency, TropCyclone.intensity_thres)
+        return self.cache.get(("curves", str(file)), build)
+
+    def write(self, curves, file, fname_base, metrics):
+        stats = curves_statistics(curves, self.return_periods, self.thresholds, method="extrapolate_constant")
+        centroids, sel_cen = self.centroids(file)
+        lat, lon = centroids.lat[sel_cen], centroids.lon[sel_cen]
+        n_rp = len(self.return_periods)
+        if "exceedance_intensity" in metrics:
+            gdf = array_to_gdf(stats[:, :n_rp], lat, lon, [f"{val:g}" for val in self.return_periods])
+            write_metric_maps(gdf, self.out_dir, fname_base, "exceedance_intensity",
+                              shapefile_path=self.shapefile_path, buffer_dist=self.buffer_dist)
+        if "return_periods" in metrics:
+            gdf = array_to_gdf(stats[:, n_rp:], lat, lon, [f"{thr:g}" for thr in self.thresholds])
+            write_metric_maps(gdf, self.out_dir, fname_base, "return_periods",
+                              shapefile_path=self.shapefile_path, buffer_dist=self.buffer_dist)
+
+    def model_maps(self, model, scenario, period, cat, wind, metrics=METRICS, tile="global"):
+        file = self.hazard_file(model, scenario, period, cat, wind)
+        print(f"Single-model maps for: {file}")
+        fname_base = f"TC_{tile}_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}"
+        self.write(self.curves(file), file, fname_base, metrics)
+
+    def combined_maps(self, models, scenario, period, cat, wind, metrics=METRICS, tile="global"):
+        files = [self.hazard_file(model, scenario, period, cat, wind) for model in models]
+        print(f"Multi-model maps for: {scenario} {period} {cat} {wind}")
+        # Curves are merged by column position, so all files must share the same centroids
+        if len({self.centroids_key(file) for file in files}) > 1:
+            raise ValueError(f"Hazard files of {scenario} {period} {cat} {wind} have different centroids")
+        # Truncating before merging is exact: merged exceedance frequencies only grow
+        combined = None
+        for file in files:
+            curves = truncate_curves(self.curves(file), self.return_periods, self.thresholds)
+            combined = truncate_curves(merge_curves(combined, curves), self.return_periods, self.thresholds)
+        fname_base = f"TC_{tile}_0300as_CHAZ_ALL-MODELS_{period}_{scenario}_{80 * len(models)}ens_{cat}_{wind}"
+        self.write(combined, files[0], fname_base, metrics)
+
+def main(models, scenarios, periods, cats, wind, metrics=METRICS, products=("model", "combined"), extent=None,
+         max_gb=64, return_periods=RETURN_PERIODS, thresholds=THRESHOLDS, sweep=None, shapefile_path=None,
+         buffer_dist=0.0):
+    thresholds = threshold_sweep(*sweep) if sweep else thresholds
+    tile = "_".join(str(val) for val in extent) if extent else "global"
+    batch = MapBatch(extent, max_gb, return_periods, thresholds, shapefile_path, buffer_dist)
+
+    # Products of the same hazard files follow each other, so every file is loaded once
+    for cat, period, scenario in itertools.product(cats, periods, scenarios):
+        if "model" in products:
+            for model in models:
+                batch.model_maps(model, scenario, period, cat, wind, metrics, tile)
+        if "combined" in products:
+            batch.combined_maps(models, scenario, period, cat, wind, metrics, tile)
+        print(f"Cache holds {batch.cache.nbytes / 1e9:.1f} GB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute the full matrix of hazard map products in one process.")
+    parser.add_argument("--models", type=str, nargs="+", default=MODELS)
+    parser.add_argument("--scenarios", type=str, nargs="+", default=["ssp245", "ssp370", "ssp585"])
+    parser.add_argument("--periods", type=str, nargs="+", default=["base", "fut1", "fut2"])
+    parser.add_argument("--cats", type=str, nargs="+", default=["SD", "CRH"], help="TCGI variants")
+    parser.add_argument("--wind", type=str, default="H08")
+    parser.add_argument("--metrics", type=str, nargs="+", default=METRICS, choices=METRICS)
+    parser.add_argument("--products", type=str, nargs="+", default=["model", "combined"], choices=["model", "combined"],
+                        help="Single-model and/or multi-model maps")
+    parser.add_argument("--extent", type=float, nargs=4, default=None,
+                        metavar=("LON_MIN", "LON_MAX", "LAT_MIN", "LAT_MAX"), help="Restrict to an extent")
+    parser.add_argument("--max_gb", type=float, default=64, help="Memory bound of the hazard cache in GB")
+    parser.add_argument("--return_periods", type=float, nargs="+", default=RETURN_PERIODS)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=THRESHOLDS)
+    parser.add_argument("--sweep", type=float, nargs=3, metavar=("MIN", "MAX", "STEP"), default=None,
+                        help="Dense threshold sweep, e.g. 18 80 1; overrides --thresholds")
+    parser.add_argument("--shapefile_path", type=str, default=None,
+                        help="Land shapefile (e.g. ne_10m_land.shp); if given, rasters only cover land cells")
+    parser.add_argument("--buffer_dist", type=float, default=0.0, help="Buffer of the land polygons in degrees")
+    args = parser.parse_args()
+    main(**vars(args))
@@ -0,0 +1,187 @@
+import os
+import sys
+import argparse
+import importlib
+import numpy as np
+from pathlib import Path
+from pathos.pools import ProcessPool as Pool
+from climada.util.constants import SYSTEM_DIR
+
+sys.path.append("/cluster/project/climate/meilers/scripts/columbia_haz_maps")
+from main.hazard_io_utils import read_centroids, column_nnz
+from main.combine_tiles import combine_tiles
+
+SCRIPT_DIR = Path("/cluster/project/climate/meilers/scripts/columbia_haz_maps/main")
+MAPS_DIR = Path("/cluster/work/climate/meilers/climada/data/hazard/future/CHAZ/maps")
+MODELS = ["CESM2", "CNRM-CM6-1", "EC-Earth3", "IPSL-CM6A-LR", "MIROC6", "UKESM1-0-LL"]
+
+# Tile script module, output variables and fixed script arguments per target
+TARGETS = {
+    "era5_exceedance_intensity": ("compute_exceedance_intensity_era5_parallel", ["exceedance_intensity"], {}),
+    "era5_return_periods": ("compute_return_periods_era5_parallel", ["return_periods"], {}),
+    "era5_maps": ("compute_hazard_maps", ["exceedance_intensity", "return_periods"], {"source": "era5"}),
+    "combined_exceedance_intensity": ("compute_combined_exceedance_intensity_parallel", ["exceedance_intensity"], {}),
+    "combined_return_periods": ("compute_combined_return_periods_parallel", ["return_periods"], {}),
+    "combined_maps": ("compute_hazard_maps", ["exceedance_intensity", "return_periods"], {"source": "combined"}),
+}
+
+def hazard_files(target, scenario=None, cat=None, wind=None, period=None):
+    """Hazard files read by the tile script of target."""
+    if target.startswith("era5"):
+        return [Path("/cluster/work/climate/meilers/climada/data/hazard/TC_global_0300as_CHAZ_ERA5_freq-corr.hdf5")]
+    haz_dir = SYSTEM_DIR / "hazard" / "future" / "CHAZ"
+    return [haz_dir / f"TC_global_0300as_CHAZ_{model}_{period}_{scenario}_80ens_{cat}_{wind}.hdf5" for model in MODELS]
+
+def base_name(target, scenario=None, cat=None, wind=None, period=None):
+    """Name part shared by the tile outputs of target, as used by combine_tiles."""
+    if target.startswith("era5"):
+        return "0300as_CHAZ_ERA5"
+    return f"0300as_CHAZ_ALL-MODELS_{period}_{scenario}_480ens_{cat}_{wind}"
+
+def _weighted_cut(coord, weight, frac):
+    """Cut value between two distinct coordinates such that about frac of the weight lies below it."""
+    values, inv = np.unique(coord, return_inverse=True)
+    if values.size < 2:
+        return None
+    cum = np.cumsum(np.bincount(inv, weights=weight))
+    target = frac * cum[-1]
+    i = min(np.searchsorted(cum, target), values.size - 2)
+    if i > 0 and abs(cum[i - 1] - target) < abs(cum[i] - target):
+        i -= 1
+    return round((values[i] + values[i + 1]) / 2, 4)
+
+def bisect_tiles(lon, lat, weight, n_tiles, extent=None):
+    """
+    Cut extent (lon_min, lon_max, lat_min, lat_max) into n_tiles tiles of about equal summed centroid weight by
+    recursive bisection along the longer side. Cuts lie between centroid coordinates, so every centroid
+    falls in exactly one tile.
+    """
+    if extent is None:
+        extent = (float(lon.min()), float(lon.max()), float(lat.min()), float(lat.max()))
+    if n_tiles == 1:
+        return [extent]
+
+    lon_min, lon_max, lat_min, lat_max = extent
+    n_low = n_tiles // 2
+    axes = ["lon", "lat"] if lon_max - lon_min >= lat_max - lat_min else ["lat", "lon"]
+    for axis in axes:
+        coord = lon if axis == "lon" else lat
+        cut = _weighted_cut(coord, weight, n_low / n_tiles)
+        if cut is not None:
+            break
+    else:
+        return [extent]
+
+    low = coord < cut
+    if axis == "lon":
+        ext_low, ext_high = (lon_min, cut, lat_min, lat_max), (cut, lon_max, lat_min, lat_max)
+    else:
+        ext_low, ext_high = (lon_min, lon_max, lat_min, cut), (lon_min, lon_max, cut, lat_max)
+    return (bisect_tiles(lon[low], lat[low], weight[low], n_low, ext_low)
+            + bisect_tiles(lon[~low], lat[~low], weight[~low], n_tiles - n_low, ext_high))
+
+def plan_tiles(files, n_tiles):
+    """Balanced tiles for the hazard files: the work per centroid is its number of nonzero events (plus one)."""
+    centroids = read_centroids(files[0])
+    weight = np.ones(centroids.size)
+    for file in files:
+        print(f"Counting nonzero events per centroid in {file}")
+        weight += column_nnz(file)
+    tiles = bisect_tiles(np.asarray(centroids.lon), np.asarray(centroids.lat), weight, n_tiles)
+    print(f"Cut {centroids.size} centroids into {len(tiles)} tiles of about {weight.sum() / len(tiles):.0f} work units")
+    return tiles
+
+def run_tile(module_name, extent, kwargs):
+    """Run the tile script main() for one extent."""
+    module = importlib.import_module(f"main.{module_name}")
+    lon_min, lon_max, lat_min, lat_max = extent
+    module.main(lon_min=lon_min, lon_max=lon_max, lat_min=lat_min, lat_max=lat_max, **kwargs)
+    return extent
+
+def run_local(target, tiles, kwargs, n_workers):
+    """Run all tiles in a local process pool."""
+    module_name, _, fixed = TARGETS[target]
+    kwargs = {**fixed, **kwargs}
+    pool = Pool(nodes=min(n_workers, len(tiles)))
+    print(f"Running {len(tiles)} tiles on {pool.nodes} workers...")
+    try:
+        for extent in pool.uimap(run_tile, [module_name] * len(tiles), tiles, [kwargs] * len(tiles)):
+            print(f"Finished tile {extent}")
+    finally:
+        pool.close()
+        pool.join()
+        pool.clear()
+
+def write_job_array(target, tiles, kwargs, job_dir, time="04:00:00", mem="64G", combine_kwargs=None):
+    """
+    Write the tile extents, a SLURM job array script and a submit script that combines the tiles afterwards.
+    combine_kwargs (e.g. shapefile_path, buffer_dist) are only passed to the combine step; None values are left out.
+    """
+    job_dir = Path(job_dir)
+    job_dir.mkdir(parents=True, exist_ok=True)
+    name = f"tiles_{target}"
+
+    tiles_file = job_dir / f"{name}.txt"
+    # Full precision: the outer extents are exact centroid coordinates and rounding would drop edge centroids
+    np.savetxt(tiles_file, np.array(tiles), fmt="%.17g")
+
+    module_name, _, fixed = TARGETS[target]
+    script = SCRIPT_DIR / f"{module_name}.py"
+    extra = " ".join(f"--{key} {value}" for key, value in {**fixed, **kwargs}.items())
+    array_file = job_dir / f"{name}_array.sh"
+    array_file.write_text(
+        "#!/bin/bash\n"
+        f"#SBATCH --job-name={name}\n"
+        f"#SBATCH --array=0-{len(tiles) - 1}\n"
+        f"#SBATCH --time={time}\n"
+        f"#SBATCH --mem={mem}\n"
+        f"#SBATCH --output={job_dir}/{name}_%a.out\n\n"
+        f"read LON_MIN LON_MAX LAT_MIN LAT_MAX < <(sed -n \"$((SLURM_ARRAY_TASK_ID + 1))p\" {tiles_file})\n"
+        f"python {script} --lon_min $LON_MIN --lon_max $LON_MAX --lat_min $LAT_MIN --lat_max $LAT_MAX {extra}\n"
+    )
+
+    combine_kwargs = {key: value for key, value in (combine_kwargs or {}).items() if value is not None}
+    combine_args = " ".join(f"--{key} {value}" for key, value in {**kwargs, **combine_kwargs}.items())
+    submit_file = job_dir / f"{name}_submit.sh"
+    submit_file.write_text(
+        "#!/bin/bash\n"
+        f"jid=$(sbatch --parsable {array_file})\n"
+        f"sbatch --dependency=afterok:$jid --job-name={name}_combine --mem={mem} "
+        f"--wrap \"python {SCRIPT_DIR / 'schedule_tiles.py'} --target {target} {combine_args} --combine_only\"\n"
+    )
+    print(f"Wrote {len(tiles)} tiles to {tiles_file}; submit with: bash {submit_file}")
+
+def main(target, n_tiles=64, mode="local", n_workers=None, job_dir=None, combine_only=False,
+         scenario=None, cat=None, wind=None, period=None, shapefile_path=None, buffer_dist=0.0):
+    kwargs = {} if target.startswith("era5") else dict(scenario=scenario, cat=cat, wind=wind, period=period)
+    if not combine_only:
+        tiles = plan_tiles(hazard_files(target, **kwargs), n_tiles)
+        if mode == "slurm":
+            write_job_array(target, tiles, kwargs, job_dir or MAPS_DIR / "jobs",
+                            combine_kwargs=dict(shapefile_path=shapefile_path, buffer_dist=buffer_dist))
+            return
+        n_workers = n_workers or int(os.environ.get("SLURM_CPUS_PER_TASK", os.cpu_count()))
+        run_local(target, tiles, kwargs, n_workers)
+
+    for variable in TARGETS[target][1]:
+        combine_tiles(MAPS_DIR, MAPS_DIR, base_name(target, **kwargs), variable, shapefile_path, buffer_dist)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cut the globe into load-balanced tiles, run them and combine the outputs.")
+    parser.add_argument("--target", type=str, required=True, choices=list(TARGETS))
+    parser.add_argument("--n_tiles", type=int, default=64, help="Number of tiles")
+    parser.add_argument("--mode", type=str, default="local", choices=["local", "slurm"],
+                        help="Run tiles in a local process pool or emit a SLURM job array")
+    parser.add_argument("--n_workers", type=int, default=None,
+                        help="Number of local worker processes (default: cores of the node or SLURM allocation)")
+    parser.add_argument("--job_dir", type=str, default=None, help="Directory for job array files (slurm mode)")
+    parser.add_argument("--combine_only", action="store_true", help="Only combine existing tile outputs")
+    parser.add_argument("--scenario", type=str, default=None, help="Climate scenario, for combined targets")
+    parser.add_argument("--cat", type=str, default=None, help="Category threshold, for combined targets")
+    parser.add_argument("--wind", type=str, default=None, help="Wind field, for combined targets")
+    parser.add_argument("--period", type=str, default=None, help="Time period, for combined targets")
+    parser.add_argument("--shapefile_path", type=str, default=None,
+                        help="Land shapefile (e.g. ne_10m_land.shp); if given, the combined rasters only cover land cells")
+    parser.add_argument("--buffer_dist", type=float, default=0.0, help="Buffer of the land polygons in degrees")
+    args = parser.parse_args()
+    main(**vars(args))
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The analysis scripts import 'main.<module>' from the repository root and the pre-processing
+# scripts import 'preproc_utils' from their own directory.
+REPO_DIR = Path(__file__).resolve().parents[1]
+sys.path[:0] = [str(REPO_DIR), str(REPO_DIR / "CHAZ-pre-processing")]
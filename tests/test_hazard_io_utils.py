@@ -0,0 +1,66 @@
+import h5py
+import numpy as np
+import pytest
+from scipy import sparse
+
+pytest.importorskip("climada")
+
+from main.hazard_io_utils import read_positions, iter_intensity_rows, coordinates_key, centroids_key, check_centroids
+
+
+def write_intensity(file, intensity):
+    with h5py.File(file, "w") as hf:
+        grp = hf.create_group("intensity")
+        grp.create_dataset("data", data=intensity.data, chunks=(64,))
+        grp.create_dataset("indices", data=intensity.indices)
+        grp.create_dataset("indptr", data=intensity.indptr)
+        grp.attrs["shape"] = intensity.shape
+
+
+def test_read_positions(tmp_path):
+    with h5py.File(tmp_path / "data.hdf5", "w") as hf:
+        dset = hf.create_dataset("data", data=np.arange(10000.0), chunks=(64,))
+        pos = np.array([3, 4, 50, 5000, 5001, 9999])
+        np.testing.assert_array_equal(read_positions(dset, pos, max_gap=10), pos)
+        np.testing.assert_array_equal(read_positions(dset, pos), pos)
+        assert read_positions(dset, np.empty(0, dtype=np.int64)).size == 0
+
+
+def test_iter_intensity_rows_columns(tmp_path):
+    intensity = sparse.random(500, 300, density=0.05, format="csr", random_state=0)
+    file = tmp_path / "hazard.hdf5"
+    write_intensity(file, intensity)
+    columns = np.r_[10:20, 150:160, 299]
+
+    chunks = list(iter_intensity_rows(file, chunk_size=64, columns=columns))
+    assert [row_0 for row_0, _ in chunks] == list(range(0, 500, 64))
+    stacked = sparse.vstack([chunk for _, chunk in chunks]).toarray()
+    np.testing.assert_array_equal(stacked, intensity[:, columns].toarray())
+
+
+def test_centroids_key_from_datasets(tmp_path):
+    lat, lon = np.linspace(-10, 10, 5), np.linspace(100, 120, 5)
+    for name, (lat_name, lon_name) in [("a", ("lat", "lon")), ("b", ("latitude", "longitude")), ("c", ("lat", "lon"))]:
+        with h5py.File(tmp_path / f"{name}.hdf5", "w") as hf:
+            hf.create_dataset(f"centroids/{lat_name}", data=lat if name != "c" else lat + 1)
+            hf.create_dataset(f"centroids/{lon_name}", data=lon)
+
+    key = coordinates_key(lat, lon)
+    assert centroids_key(tmp_path / "a.hdf5") == key
+    check_centroids(tmp_path / "b.hdf5", key)
+    with pytest.raises(ValueError):
+        check_centroids(tmp_path / "c.hdf5", key)
+
+
+def test_centroids_key_of_climada_file(tmp_path):
+    from climada.hazard import Centroids, TropCyclone
+
+    centroids = Centroids(lat=np.array([10.0, 11.0, 12.0]), lon=np.array([120.0, 121.0, 122.0]))
+    hazard = TropCyclone(
+        haz_type="TC", units="m/s", centroids=centroids, event_id=np.array([1]), event_name=["ev1"],
+        frequency=np.array([0.1]), date=np.array([730000]), orig=np.array([True]),
+        intensity=sparse.csr_matrix(np.array([[30.0, 0.0, 40.0]])),
+    )
+    file = tmp_path / "hazard.hdf5"
+    hazard.write_hdf5(file)
+    assert centroids_key(file) == coordinates_key(centroids.lat, centroids.lon)
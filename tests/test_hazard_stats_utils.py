@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from scipy import sparse
+
+from main.hazard_stats_utils import exceedance_intensity, return_period, hazard_statistics
+
+
+# Three centroids: one event hit, no event hit and two events hit
+INTENSITY = sparse.csr_matrix(np.array([
+    [0.0, 0.0, 50.0],
+    [40.0, 0.0, 30.0],
+    [0.0, 0.0, 0.0],
+]))
+FREQUENCY = np.array([0.01, 0.1, 0.5])
+
+
+def test_exceedance_intensity_single_point_and_empty():
+    exceed = exceedance_intensity(INTENSITY, FREQUENCY, return_periods=[5, 10, 100])
+    # One point (40, 0.1): return periods of at least 10 years give the intensity, shorter ones 0
+    np.testing.assert_allclose(exceed[0], [0.0, 40.0, 40.0])
+    # No intensity: 0 everywhere
+    np.testing.assert_array_equal(exceed[1], [0.0, 0.0, 0.0])
+    # Curve (50, 0.01), (30, 0.11): constant beyond the largest intensity, 0 below the curve
+    assert exceed[2, 0] == 0.0
+    assert 30.0 < exceed[2, 1] < 50.0
+    np.testing.assert_allclose(exceed[2, 2], 50.0)
+
+
+def test_return_period_single_point_and_empty():
+    rp = return_period(INTENSITY, FREQUENCY, thresholds=[20, 40, 45])
+    # One point (40, 0.1): thresholds up to the intensity give 10 years, above it NaN
+    np.testing.assert_allclose(rp[0], [10.0, 10.0, np.nan])
+    # No intensity: NaN everywhere
+    assert np.isnan(rp[1]).all()
+    # Below the smallest intensity the return period of the smallest intensity is kept
+    np.testing.assert_allclose(rp[2, 0], 1 / 0.11)
+    assert 1 / 0.11 < rp[2, 1] < 100.0
+
+
+def test_hazard_statistics_matches_separate_kernels():
+    exceed, rp = hazard_statistics(INTENSITY, FREQUENCY, return_periods=[5, 10, 100], thresholds=[20, 40, 45])
+    np.testing.assert_array_equal(exceed, exceedance_intensity(INTENSITY, FREQUENCY, return_periods=[5, 10, 100]))
+    np.testing.assert_array_equal(rp, return_period(INTENSITY, FREQUENCY, thresholds=[20, 40, 45]))
+
+
+@pytest.mark.parametrize("func", [exceedance_intensity, return_period, hazard_statistics])
+def test_interpolate_is_rejected(func):
+    with pytest.raises(ValueError):
+        func(INTENSITY, FREQUENCY, method="interpolate")
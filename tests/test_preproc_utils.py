@@ -0,0 +1,128 @@
+import json
+
+import h5py
+import numpy as np
+import pytest
+from scipy import sparse
+
+pytest.importorskip("climada")
+pytest.importorskip("pathos")
+
+from climada.hazard import Centroids, TropCyclone
+
+from preproc_utils import BASIN_BOUNDARIES, basin_labels, partition_hazard_by_basin, stack_basin_hazards
+from preproc_utils import encode_event_ids, write_event_codes, read_event_names, event_names
+
+
+def small_hazard(n_events=3):
+    """One centroid in each basin, with events hitting every centroid."""
+    lat = np.array([15.0, 25.0, 15.0, -15.0, -15.0, 20.0])
+    lon = np.array([-120.0, -60.0, 80.0, 60.0, 170.0, 140.0])
+    rng = np.random.default_rng(0)
+    intensity = sparse.csr_matrix(rng.uniform(20, 60, (n_events, lat.size)))
+    return TropCyclone(
+        haz_type="TC",
+        units="m/s",
+        centroids=Centroids(lat=lat, lon=lon),
+        event_id=np.arange(1, n_events + 1),
+        event_name=[f"ev{i}" for i in range(n_events)],
+        frequency=np.full(n_events, 0.1),
+        date=np.full(n_events, 730000),
+        orig=np.ones(n_events, dtype=bool),
+        intensity=intensity,
+        fraction=intensity.copy(),
+    )
+
+
+def global_hazard():
+    hazard = small_hazard()
+    labels = basin_labels(hazard.centroids.lat, hazard.centroids.lon)
+    basins = partition_hazard_by_basin(hazard, labels)
+    encode_event_ids(basins)
+    return basins, stack_basin_hazards(basins)
+
+
+def test_stack_basin_hazards_block_diagonal():
+    basins, glob = global_hazard()
+    assert glob.centroids.size == sum(haz.centroids.size for haz in basins.values())
+    assert glob.size == sum(haz.size for haz in basins.values())
+    assert glob.event_name == []
+    dense = glob.intensity.toarray()
+    row = col = 0
+    for haz in basins.values():
+        cols = slice(col, col + haz.centroids.size)
+        block = dense[row:row + haz.size]
+        np.testing.assert_array_equal(block[:, cols], haz.intensity.toarray())
+        assert not np.delete(block, np.arange(dense.shape[1])[cols], axis=1).any()
+        row += haz.size
+        col += haz.centroids.size
+    np.testing.assert_array_equal(
+        glob.centroids.region_id,
+        np.concatenate([haz.centroids.region_id for haz in basins.values()]),
+    )
+
+
+def test_global_hazard_hdf5_round_trip(tmp_path):
+    _, glob = global_hazard()
+    file = tmp_path / "TC_global.hdf5"
+    glob.write_hdf5(file)
+    write_event_codes(file, glob.event_id, "MODEL", "CRH")
+
+    loaded = TropCyclone.from_hdf5(file)
+    np.testing.assert_array_equal(loaded.event_id, glob.event_id)
+    np.testing.assert_array_equal(loaded.frequency, glob.frequency)
+    assert loaded.intensity.shape == glob.intensity.shape
+    assert (loaded.intensity != glob.intensity).nnz == 0
+    assert list(loaded.event_name) == []
+    assert read_event_names(file) == event_names(glob.event_id, "MODEL", "CRH")
+    assert read_event_names(file)[0] == f"MODEL_CRH_ev0_{list(BASIN_BOUNDARIES)[0]}"
+
+
+def test_materialize_freq_sidecar_round_trip(tmp_path, monkeypatch):
+    import preproc_utils
+    monkeypatch.setattr(preproc_utils, "BASIN_LABELS_DIR", tmp_path / "basin_labels")
+
+    source_file = tmp_path / "TC_global_0300as_CHAZ_source.hdf5"
+    small_hazard().write_hdf5(source_file)
+    basins, glob = global_hazard()
+    for haz in basins.values():
+        haz.frequency = haz.frequency * 2
+    sidecar_file = tmp_path / "TC_global_0300as_CHAZ_MODEL_CRH_sidecar.hdf5"
+    yrly_freq = {bsn: 1.0 for bsn in BASIN_BOUNDARIES}
+    preproc_utils.write_freq_sidecar(sidecar_file, basins, [source_file], yrly_freq, "MODEL", "CRH")
+
+    out_files = preproc_utils.materialize_freq_sidecar(sidecar_file, tmp_path, n_workers=1)
+    assert out_files['global'].name == "TC_global_0300as_CHAZ_MODEL_CRH.hdf5"
+    loaded = TropCyclone.from_hdf5(out_files['global'])
+    np.testing.assert_array_equal(loaded.event_id, glob.event_id)
+    np.testing.assert_allclose(loaded.frequency, glob.frequency * 2)
+    assert (loaded.intensity != glob.intensity).nnz == 0
+    assert read_event_names(out_files['global']) == event_names(glob.event_id, "MODEL", "CRH")
+    for bsn in BASIN_BOUNDARIES:
+        loaded_bsn = TropCyclone.from_hdf5(out_files[bsn])
+        np.testing.assert_array_equal(loaded_bsn.event_id, basins[bsn].event_id)
+
+    stacked = preproc_utils.load_freq_sidecar(sidecar_file, n_workers=1)
+    np.testing.assert_array_equal(stacked.event_id, glob.event_id)
+    assert stacked.event_name == []
+
+
+def test_update_sidecar_frequency_leaves_sidecar_unchanged(tmp_path):
+    import preproc_utils
+    basins, _ = global_hazard()
+    sidecar_file = tmp_path / "TC_global_0300as_CHAZ_MODEL_CRH_sidecar.hdf5"
+    yrly_freq = {bsn: 1.0 for bsn in BASIN_BOUNDARIES}
+    preproc_utils.write_freq_sidecar(sidecar_file, basins, [], yrly_freq, "MODEL", "CRH")
+    stat = sidecar_file.stat()
+
+    new_freq = dict(yrly_freq, NA=3.0)
+    out_file = tmp_path / "TC_global_0300as_CHAZ_MODEL_CRH_new_sidecar.hdf5"
+    preproc_utils.update_sidecar_frequency(sidecar_file, new_freq, out_file)
+    assert sidecar_file.stat().st_mtime_ns == stat.st_mtime_ns
+    with h5py.File(sidecar_file, 'r') as f_old, h5py.File(out_file, 'r') as f_new:
+        scale = np.where(f_old['basin'][:] == list(BASIN_BOUNDARIES).index('NA'), 3.0, 1.0)
+        np.testing.assert_allclose(f_new['frequency'][:], f_old['frequency'][:] * scale)
+        assert json.loads(f_new.attrs['yrly_freq']) == new_freq
+
+    with pytest.raises(ValueError):
+        preproc_utils.update_sidecar_frequency(sidecar_file, new_freq, sidecar_file)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("climada")
+pytest.importorskip("pathos")
+
+from main.schedule_tiles import write_job_array
+
+
+def test_write_job_array_forwards_combine_arguments(tmp_path):
+    tiles = [(-180.0, 0.0, -60.0, 60.0), (0.0, 180.0, -60.0, 60.0)]
+    kwargs = dict(scenario="ssp585", cat="CRH", wind="H08", period="2041-2060")
+    write_job_array("combined_maps", tiles, kwargs, tmp_path,
+                    combine_kwargs=dict(shapefile_path="/data/ne_10m_land.shp", buffer_dist=0.1))
+
+    submit = (tmp_path / "tiles_combined_maps_submit.sh").read_text()
+    assert "--combine_only" in submit
+    assert "--shapefile_path /data/ne_10m_land.shp" in submit
+    assert "--buffer_dist 0.1" in submit
+    assert "--scenario ssp585" in submit and "--period 2041-2060" in submit
+    np.testing.assert_array_equal(np.loadtxt(tmp_path / "tiles_combined_maps.txt"), np.array(tiles))
+
+    array = (tmp_path / "tiles_combined_maps_array.sh").read_text()
+    assert "--shapefile_path" not in array
+    assert "#SBATCH --array=0-1" in array
+
+
+def test_write_job_array_leaves_out_missing_shapefile(tmp_path):
+    write_job_array("era5_maps", [(0.0, 1.0, 0.0, 1.0)], {}, tmp_path,
+                    combine_kwargs=dict(shapefile_path=None, buffer_dist=0.0))
+    submit = (tmp_path / "tiles_era5_maps_submit.sh").read_text()
+    assert "--shapefile_path" not in submit
+